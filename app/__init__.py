@@ -2,6 +2,7 @@
 from flask import Flask, url_for
 from .extensions import db, migrate, login_manager
 from .config import Config
+from . import expiry, memo
 
 # Импортируем все модели **здесь**, чтобы Alembic их видел
 from .models import Team, Task, Answer, TeamBlockStart
@@ -15,6 +16,8 @@ def create_app():
     migrate.init_app(app, db)
 
     login_manager.init_app(app)
+    memo.init_app(app)
+    expiry.init_app(app)
     @login_manager.user_loader
     def load_user(user_id):
         # user_id хранится как str — приводим к int
@@ -0,0 +1,243 @@
+# app/catalog.py
+# Структура турниров (блоки → задачи → примеры, с ответами-ключами и баллами),
+# закешированная в памяти воркера. Вместе со структурой разбираются ключи
+# ответов (app/grading.py).
+#
+# Содержимое турнира во время игры не меняется, поэтому структура читается из БД
+# один раз (одним запросом с join) и дальше отдаётся из памяти как неизменяемые
+# объекты со __slots__. Кеш привязан к Tournament.content_version: админка
+# увеличивает её через bump_content_version(), и все воркеры сбрасывают кеш по
+# событию CONTENT_CHANNEL. На случай пропущенного события версия перепроверяется
+# не чаще раза в STRUCTURE_CHECK_INTERVAL секунд.
+#
+# После ручных правок задач в БД нужно поднять версию:
+#   UPDATE tournaments SET content_version = content_version + 1 WHERE id = ...;
+import time
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+from .events import add_listener, notify, CONTENT_CHANNEL
+from .extensions import db
+from .grading import compile_keys, forget_keys
+from .models import Tournament, TaskBlock, Task
+
+STRUCTURE_CHECK_INTERVAL = 60
+
+
+def load_tournament_catalog(tournament_id):
+    """
+    Турнир со всей структурой (блоки → задачи → примеры) одним запросом с join.
+    Читает только этот турнир — стоимость не растёт с числом других/архивных турниров.
+    Возвращает Tournament или None.
+    """
+    return Tournament.query.options(
+        joinedload(Tournament.blocks).joinedload(TaskBlock.tasks).joinedload(Task.examples)
+    ).filter(Tournament.id == tournament_id).one_or_none()
+
+
+class _Frozen:
+    """Объект только для чтения: поля задаются один раз при сборке структуры."""
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.id}>"
+
+
+class ExampleInfo(_Frozen):
+    __slots__ = ("id", "task_id", "text", "correct_answer", "points")
+
+
+class TaskInfo(_Frozen):
+    # examples — по id; block — BlockInfo задачи
+    __slots__ = (
+        "id", "block_id", "block", "title", "text", "type", "image_url",
+        "correct_answer", "points", "order", "examples", "_examples",
+    )
+
+    def example(self, example_id):
+        """Пример этой задачи по id или None."""
+        return _lookup(self._examples, example_id)
+
+
+class BlockInfo(_Frozen):
+    # tasks — по (order, id), задачи без order в конце
+    __slots__ = (
+        "id", "tournament_id", "name", "order", "max_duration", "image_url",
+        "required_slots", "tasks",
+    )
+
+
+class TournamentInfo(_Frozen):
+    """Структура турнира; blocks — по (order, id). Поиск блока/задачи/примера по id — из словарей."""
+
+    __slots__ = ("id", "name", "group", "content_version", "blocks", "_blocks", "_tasks", "_examples")
+
+    def block(self, block_id):
+        return _lookup(self._blocks, block_id)
+
+    def task(self, task_id):
+        return _lookup(self._tasks, task_id)
+
+    def example(self, example_id):
+        return _lookup(self._examples, example_id)
+
+
+def _lookup(index, key):
+    try:
+        return index.get(int(key))
+    except (TypeError, ValueError):
+        return None
+
+
+def _build(tournament):
+    blocks, block_map, task_map, example_map = [], {}, {}, {}
+    for b in sorted(tournament.blocks, key=lambda b: (b.order, b.id)):
+        tasks = []
+        for t in sorted(b.tasks, key=lambda t: (t.order is None, t.order or 0, t.id)):
+            examples = tuple(
+                ExampleInfo(id=ex.id, task_id=ex.task_id, text=ex.text, correct_answer=ex.correct_answer, points=ex.points)
+                for ex in sorted(t.examples, key=lambda ex: ex.id)
+            )
+            task = TaskInfo(
+                id=t.id, block_id=t.block_id, block=None, title=t.title, text=t.text, type=t.type,
+                image_url=t.image_url, correct_answer=t.correct_answer, points=t.points, order=t.order,
+                examples=examples, _examples={ex.id: ex for ex in examples},
+            )
+            tasks.append(task)
+            task_map[task.id] = task
+            example_map.update((ex.id, ex) for ex in examples)
+        block = BlockInfo(
+            id=b.id, tournament_id=b.tournament_id, name=b.name, order=b.order, max_duration=b.max_duration,
+            image_url=b.image_url, required_slots=b.required_slots, tasks=tuple(tasks),
+        )
+        for task in tasks:
+            # обратная ссылка задача → блок; объекты ещё не отданы наружу
+            object.__setattr__(task, "block", block)
+        blocks.append(block)
+        block_map[block.id] = block
+
+    return TournamentInfo(
+        id=tournament.id, name=tournament.name, group=tournament.group,
+        content_version=tournament.content_version, blocks=tuple(blocks),
+        _blocks=block_map, _tasks=task_map, _examples=example_map,
+    )
+
+
+_structures = {}     # tournament_id -> TournamentInfo
+_checked = {}        # tournament_id -> time.monotonic() последней сверки версии
+_block_index = {}    # block_id -> tournament_id
+_task_index = {}     # task_id -> tournament_id
+
+
+def _forget(tournament_id):
+    info = _structures.pop(tournament_id, None)
+    _checked.pop(tournament_id, None)
+    if info is not None:
+        forget_keys(info)
+        for block_id in info._blocks:
+            _block_index.pop(block_id, None)
+        for task_id in info._tasks:
+            _task_index.pop(task_id, None)
+
+
+def _on_content_event(payload):
+    # структура изменена (в этом или другом воркере) — перечитаем при следующем обращении
+    info = _structures.get(payload.get("k"))
+    if info is not None and info.content_version != payload.get("v"):
+        _forget(payload["k"])
+
+
+def _load(tournament_id):
+    # сброс кеша в других воркерах приходит событием
+    add_listener(CONTENT_CHANNEL, _on_content_event)
+    tournament = load_tournament_catalog(tournament_id)
+    _forget(tournament_id)
+    if tournament is None:
+        return None
+    info = _build(tournament)
+    compile_keys(info)
+    _structures[tournament_id] = info
+    _checked[tournament_id] = time.monotonic()
+    _block_index.update((block_id, tournament_id) for block_id in info._blocks)
+    _task_index.update((task_id, tournament_id) for task_id in info._tasks)
+    return info
+
+
+def tournament_structure(tournament_id):
+    """
+    TournamentInfo турнира или None, если его нет.
+    Из памяти воркера; запрос к БД — только при первом обращении и после смены content_version.
+    """
+    try:
+        tournament_id = int(tournament_id)
+    except (TypeError, ValueError):
+        return None
+
+    info = _structures.get(tournament_id)
+    if info is not None:
+        now = time.monotonic()
+        if now - _checked.get(tournament_id, 0) < STRUCTURE_CHECK_INTERVAL:
+            return info
+        version = db.session.query(Tournament.content_version).filter(Tournament.id == tournament_id).scalar()
+        if version == info.content_version:
+            _checked[tournament_id] = now
+            return info
+    return _load(tournament_id)
+
+
+def block_structure(block_id):
+    """BlockInfo блока или None."""
+    try:
+        block_id = int(block_id)
+    except (TypeError, ValueError):
+        return None
+    tournament_id = _block_index.get(block_id)
+    if tournament_id is None:
+        tournament_id = db.session.query(TaskBlock.tournament_id).filter(TaskBlock.id == block_id).scalar()
+        if tournament_id is None:
+            return None
+    info = tournament_structure(tournament_id)
+    return info.block(block_id) if info is not None else None
+
+
+def task_structure(task_id):
+    """TaskInfo задачи (с примерами и блоком) или None."""
+    try:
+        task_id = int(task_id)
+    except (TypeError, ValueError):
+        return None
+    tournament_id = _task_index.get(task_id)
+    if tournament_id is None:
+        tournament_id = db.session.query(TaskBlock.tournament_id).join(
+            Task, Task.block_id == TaskBlock.id
+        ).filter(Task.id == task_id).scalar()
+        if tournament_id is None:
+            return None
+    info = tournament_structure(tournament_id)
+    return info.task(task_id) if info is not None else None
+
+
+def bump_content_version(tournament_id):
+    """
+    Увеличивает версию содержимого турнира после изменения блоков/задач/примеров.
+    Вызывать до commit: воркеры сбросят кеш структуры по событию после commit.
+    """
+    rows = db.session.execute(
+        update(Tournament)
+        .where(Tournament.id == tournament_id)
+        .values(content_version=Tournament.content_version + 1)
+        .returning(Tournament.id, Tournament.content_version)
+    ).all()
+    for tid, version in rows:
+        notify(CONTENT_CHANNEL, tid, v=version)
+        _forget(tid)
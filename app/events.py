@@ -0,0 +1,180 @@
+# app/events.py
+# Push-уведомления между воркерами через PostgreSQL LISTEN/NOTIFY.
+#
+# notify() ставит pg_notify в текущую транзакцию — событие уходит только после
+# commit, вместе с данными. В каждом воркере поднимается один поток-слушатель
+# (лениво, уже после fork) с отдельным соединением; он раздаёт события
+# подписчикам этого процесса (SSE-потокам) через очереди.
+import json
+import queue
+import select
+import threading
+import time
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import text
+from .extensions import db
+
+# канал изменений результатов: ключ — tournament_id, данные {"v": score_version}
+# и "teams" — id команд, чьи очки могли измениться (нет поля — любые)
+SCOREBOARD_CHANNEL = "scoreboard"
+
+# начала и окончания блоков команд: ключ — tournament_id, данные
+# {"team_id", "block_id", "reason": "started" | "completed" | "timeout", ...};
+# "reset" — сброс из админки (без team_id — для всех команд турнира)
+BLOCKS_CHANNEL = "blocks"
+
+# те же переходы блоков для SSE-потока страницы команды: ключ — team_id,
+# данные {"block_id", "reason"}
+TEAM_CHANNEL = "team"
+
+# изменения структуры турнира из админки: ключ — tournament_id, данные {"v": content_version}
+CONTENT_CHANNEL = "content"
+
+CHANNELS = (SCOREBOARD_CHANNEL, BLOCKS_CHANNEL, TEAM_CHANNEL, CONTENT_CHANNEL)
+
+
+def notify(channel, key, **data):
+    """
+    Отправляет событие всем воркерам после commit текущей транзакции.
+    key — ключ подписки (например, id турнира), data — JSON-совместимые поля события.
+    """
+    db.session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": channel, "payload": json.dumps(dict(data, k=key))},
+    )
+
+
+class Subscription:
+    """Очередь событий одного подписчика; закрывать через close()."""
+
+    def __init__(self, hub, channel, key):
+        self.hub = hub
+        self.channel = channel
+        self.key = key
+        self.queue = queue.Queue(maxsize=100)
+
+    def get(self, timeout):
+        """Ждёт событие; None по таймауту. Накопившиеся события склеиваются в последнее."""
+        try:
+            event = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        while True:
+            try:
+                event = self.queue.get_nowait()
+            except queue.Empty:
+                return event
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # подписчик не успевает читать — достаточно последнего события
+            pass
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Hub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = defaultdict(set)  # (channel, key) -> {Subscription}
+        self._listeners = defaultdict(list)  # channel -> [callback(payload)]
+        self._thread = None
+
+    def _ensure_thread(self, app):
+        # вызывается под self._lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, args=(app,), name="pg-listen", daemon=True)
+            self._thread.start()
+
+    def subscribe(self, app, channel, key):
+        sub = Subscription(self, channel, key)
+        with self._lock:
+            self._subs[(channel, key)].add(sub)
+            self._ensure_thread(app)
+        return sub
+
+    def add_listener(self, app, channel, callback):
+        with self._lock:
+            if callback not in self._listeners[channel]:
+                self._listeners[channel].append(callback)
+            self._ensure_thread(app)
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            subs = self._subs.get((sub.channel, sub.key))
+            if subs:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[(sub.channel, sub.key)]
+
+    def dispatch(self, channel, payload):
+        """Раздаёт событие подписчикам текущего процесса по ключу payload["k"]."""
+        with self._lock:
+            targets = list(self._subs.get((channel, payload.get("k")), ()))
+            listeners = list(self._listeners.get(channel, ()))
+        for sub in targets:
+            sub.put(payload)
+        for callback in listeners:
+            callback(payload)
+
+    def _run(self, app):
+        while True:
+            conn = None
+            try:
+                with app.app_context():
+                    raw = db.engine.raw_connection()
+                    conn = raw.driver_connection
+                    # соединение живёт всё время работы воркера — забираем его из пула
+                    raw.detach()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    for channel in CHANNELS:
+                        cur.execute(f"LISTEN {channel}")
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        n = conn.notifies.pop(0)
+                        try:
+                            payload = json.loads(n.payload)
+                        except ValueError:
+                            continue
+                        try:
+                            self.dispatch(n.channel, payload)
+                        except Exception:
+                            app.logger.exception("pg event dispatch failed")
+            except Exception:
+                app.logger.exception("pg listener failed, reconnecting")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                time.sleep(1)
+
+
+hub = _Hub()
+
+
+def subscribe(channel, key):
+    """Подписка текущего процесса на события channel с ключом key."""
+    return hub.subscribe(current_app._get_current_object(), channel, key)
+
+
+def add_listener(channel, callback):
+    """
+    Вызывать callback(payload) в потоке-слушателе на каждое событие channel
+    (с любым ключом) — для сброса кешей процесса при изменениях в других воркерах.
+    """
+    hub.add_listener(current_app._get_current_object(), channel, callback)
@@ -0,0 +1,255 @@
+# app/expiry.py
+# Планировщик окончания блоков по времени.
+#
+# Поток планировщика поднимается в каждом воркере, но работает только один из
+# них — тот, кто взял advisory-блокировку PostgreSQL EXPIRY_LOCK_KEY на отдельном
+# соединении. Остальные раз в RELOAD_INTERVAL секунд пробуют её взять: если
+# воркер-лидер умрёт, соединение закроется, блокировка освободится, и работу
+# подхватит другой воркер.
+#
+# Лидер держит кучу (heapq) дедлайнов идущих блоков (started_at + max_duration)
+# и просыпается ровно к ближайшему. На дедлайне окончание записывается через
+# utils.finish_team_block — UPDATE ... WHERE finished_at IS NULL, так что и при
+# смене лидера событие BLOCKS_CHANNEL ("timeout") уходит один раз.
+#
+# Новые блоки попадают в кучу по событию "started" из /start_block; первый блок
+# (идёт с team.started_at) и всё пропущенное подхватывает перечитывание из БД
+# раз в RELOAD_INTERVAL секунд. Тогда же лидер удаляет устаревшие ключи повторов
+# запросов (idempotency.prune_idempotency_keys).
+import heapq
+import threading
+from datetime import datetime, timezone, timedelta
+from flask import current_app
+from sqlalchemy import func, select
+from sqlalchemy.orm import aliased
+from .events import add_listener, notify, BLOCKS_CHANNEL, TEAM_CHANNEL
+from .extensions import db
+from .idempotency import prune_idempotency_keys
+from .catalog import block_structure
+from .models import Team, TaskBlock, TeamBlockStart
+from .utils import finish_team_block, forget_team_status
+
+RELOAD_INTERVAL = 60
+
+# ключ pg_try_advisory_lock лидера планировщиков ("blkx")
+EXPIRY_LOCK_KEY = 0x626C6B78
+
+
+class SystemClock:
+    """Часы планировщика. В тестах подменяются объектом с теми же now()/wait()."""
+
+    def now(self):
+        return datetime.now(timezone.utc)
+
+    def wait(self, wakeup, seconds):
+        """Ждёт seconds секунд или пока не выставят wakeup (threading.Event)."""
+        wakeup.wait(seconds)
+
+
+def announce_block_start(team_id, block, started_at):
+    """Сообщает планировщикам о начатом блоке. Вызывать до commit."""
+    notify(
+        BLOCKS_CHANNEL, block.tournament_id,
+        team_id=team_id, block_id=block.id, reason="started",
+        deadline=(started_at + timedelta(seconds=block.max_duration)).isoformat(),
+    )
+    notify(TEAM_CHANNEL, team_id, block_id=block.id, reason="started")
+    forget_team_status(team_id)
+
+
+class ExpiryScheduler:
+    def __init__(self, app, clock=None):
+        self.app = app
+        self.clock = clock or SystemClock()
+        self._heap = []        # (deadline, team_id, block_id)
+        self._scheduled = {}   # (team_id, block_id) -> deadline
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._leader = None    # соединение psycopg2, держащее EXPIRY_LOCK_KEY
+        self._reload_at = None
+
+    def schedule(self, team_id, block_id, deadline):
+        """Добавляет дедлайн блока команды; потокобезопасно."""
+        with self._lock:
+            if self._scheduled.get((team_id, block_id)) == deadline:
+                return
+            self._scheduled[(team_id, block_id)] = deadline
+            heapq.heappush(self._heap, (deadline, team_id, block_id))
+            earliest = self._heap[0][0] == deadline
+        if earliest:
+            self._wakeup.set()
+
+    def next_deadline(self):
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def load(self):
+        """Перечитывает из БД все идущие блоки (нужен app context)."""
+        for team_id, block_id, started_at, max_duration in db.session.query(
+            TeamBlockStart.team_id, TeamBlockStart.block_id, TeamBlockStart.started_at, TaskBlock.max_duration
+        ).join(TaskBlock, TaskBlock.id == TeamBlockStart.block_id).filter(
+            TeamBlockStart.finished_at.is_(None)
+        ):
+            self.schedule(team_id, block_id, started_at + timedelta(seconds=max_duration))
+
+        # первые блоки без записи TeamBlockStart идут с team.started_at
+        other = aliased(TaskBlock)
+        first_order = select(func.min(other.order)).where(
+            other.tournament_id == Team.tournament_id
+        ).scalar_subquery()
+        for team_id, block_id, started_at, max_duration in db.session.query(
+            Team.id, TaskBlock.id, Team.started_at, TaskBlock.max_duration
+        ).join(TaskBlock, TaskBlock.tournament_id == Team.tournament_id).filter(
+            Team.started_at.isnot(None),
+            TaskBlock.order == first_order,
+            ~db.session.query(TeamBlockStart.id).filter(
+                TeamBlockStart.team_id == Team.id, TeamBlockStart.block_id == TaskBlock.id
+            ).exists(),
+        ):
+            self.schedule(team_id, block_id, started_at + timedelta(seconds=max_duration))
+        db.session.remove()
+
+    def run_due(self):
+        """
+        Закрывает все блоки с дедлайном <= clock.now() (нужен app context).
+        Возвращает список закрытых (team_id, block_id).
+        """
+        now = self.clock.now()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                deadline, team_id, block_id = heapq.heappop(self._heap)
+                if self._scheduled.get((team_id, block_id)) != deadline:
+                    continue  # устаревшая запись
+                del self._scheduled[(team_id, block_id)]
+                due.append((deadline, team_id, block_id))
+
+        for deadline, team_id, block_id in due:
+            block = block_structure(block_id)
+            team = db.session.get(Team, team_id)
+            if block is None or team is None:
+                continue
+            started_at = deadline - timedelta(seconds=block.max_duration)
+            finish_team_block(team_id, block, started_at, deadline, "timeout")
+        if due:
+            db.session.commit()
+        db.session.remove()
+        return [(team_id, block_id) for _, team_id, block_id in due]
+
+    @property
+    def is_leader(self):
+        return self._leader is not None
+
+    def lead(self):
+        """
+        True, если этот планировщик — лидер: держит EXPIRY_LOCK_KEY (проверяет,
+        что соединение живо) или только что взял её (нужен app context).
+        """
+        if self._leader is not None:
+            try:
+                with self._leader.cursor() as cur:
+                    cur.execute("SELECT 1")
+                return True
+            except Exception:
+                self.app.logger.exception("block expiry leader connection lost")
+                self.resign()
+
+        raw = db.engine.raw_connection()
+        conn = raw.driver_connection
+        # соединение держит блокировку всё время лидерства — забираем его из пула
+        raw.detach()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_lock(%s)", (EXPIRY_LOCK_KEY,))
+                acquired = cur.fetchone()[0]
+        except Exception:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self._leader = conn
+        return True
+
+    def resign(self):
+        """Отдаёт лидерство (закрывает соединение с блокировкой) и забывает дедлайны."""
+        conn, self._leader = self._leader, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._lock:
+            self._heap.clear()
+            self._scheduled.clear()
+        self._reload_at = None
+
+    def tick(self):
+        """
+        Один проход планировщика (нужен app context): лидер перечитывает БД, если
+        пора, и закрывает просроченные блоки. Возвращает закрытые (team_id, block_id);
+        не лидер ничего не делает и возвращает [].
+        """
+        if not self.lead():
+            return []
+        now = self.clock.now()
+        if self._reload_at is None or now >= self._reload_at:
+            self.load()
+            self._reload_at = now + timedelta(seconds=RELOAD_INTERVAL)
+            prune_idempotency_keys()
+        return self.run_due()
+
+    def _on_event(self, payload):
+        # дедлайны держит только лидер; новый лидер прочитает их из БД
+        if self._leader is None:
+            return
+        if payload.get("reason") == "started" and payload.get("deadline"):
+            self.schedule(payload["team_id"], payload["block_id"], datetime.fromisoformat(payload["deadline"]))
+
+    def _run(self):
+        while True:
+            try:
+                # сбрасываем до чтения кучи: schedule() после этого места разбудит поток
+                self._wakeup.clear()
+                with self.app.app_context():
+                    self.tick()
+                if self._leader is None:
+                    # лидер — другой воркер: пробуем снова через RELOAD_INTERVAL
+                    self.clock.wait(self._wakeup, RELOAD_INTERVAL)
+                    continue
+                next_at = self.next_deadline()
+                wake_at = min(next_at, self._reload_at) if next_at else self._reload_at
+                self.clock.wait(self._wakeup, max(0, (wake_at - self.clock.now()).total_seconds()))
+            except Exception:
+                self.app.logger.exception("block expiry scheduler failed")
+                self.clock.wait(self._wakeup, 1)
+
+    def start(self):
+        """Запускает поток планировщика (один раз)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self.app.app_context():
+            add_listener(BLOCKS_CHANNEL, self._on_event)
+        self._thread = threading.Thread(target=self._run, name="block-expiry", daemon=True)
+        self._thread.start()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def init_app(app):
+    """Поднимает планировщик в воркере при первом запросе (после fork gunicorn)."""
+    if not app.config.get("BLOCK_EXPIRY_SCHEDULER"):
+        return
+
+    @app.before_request
+    def _start_expiry_scheduler():
+        global _scheduler
+        if _scheduler is None:
+            with _scheduler_lock:
+                if _scheduler is None:
+                    _scheduler = ExpiryScheduler(current_app._get_current_object())
+                    _scheduler.start()
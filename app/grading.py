@@ -0,0 +1,135 @@
+# app/grading.py
+# Проверка ответов по ключу.
+#
+# Ключ задачи или примера (correct_answer) разбирается один раз — при загрузке
+# структуры турнира в воркер (app/catalog.py) — в AnswerKey: нормализованные
+# варианты и их числовые значения. Ключи лежат в словаре воркера по
+# (task_id, example_id) и сбрасываются вместе со структурой при смене
+# content_version, поэтому проверка ответа не читает БД, а живая проверка и
+# перепроверка из админки дают одинаковый результат.
+#
+# Правила сравнения:
+#   - пробелы по краям отбрасываются, подряд идущие — схлопываются, регистр не важен;
+#   - похожие кириллические и латинские буквы ("Петя" / "Пeтя" с латинской e) и ё/е равны;
+#   - числа — только обычной десятичной записью ("22", "-3", "22.5", "22,5") —
+#     сравниваются по значению: "22" == "22.0" == "22,0"; "+22", "022", "2.2e1",
+#     "044/2" числом не считаются и для ключа "22" неверны;
+#   - дробь ("1/2") засчитывается, только если в ключе дробь, и только
+#     несократимая: для ключа "1/2" (или "2/4") верно "1/2", но не "2/4" и не "0.5";
+#   - несколько допустимых ответов в ключе разделяются "|": "Петя|Пётр".
+import re
+from fractions import Fraction
+from math import gcd
+
+ALTERNATIVES_SEPARATOR = "|"
+
+# кириллица -> латиница для букв, которые в нижнем регистре или в заглавном
+# написании не отличить на глаз
+_LOOKALIKES = str.maketrans({
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h",
+    "о": "o", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i",
+})
+
+_SPACES = re.compile(r"\s+")
+# без знака "+" и ведущих нулей: "022" — скорее опечатка, чем 22
+_DECIMAL = re.compile(r"^-?(?:0|[1-9]\d*)(?:[.,]\d+)?$")
+_FRACTION = re.compile(r"^-?([1-9]\d*)/([1-9]\d*)$")
+
+
+def normalize_answer(text):
+    """Нормализованная строка ответа для сравнения (см. правила в начале модуля)."""
+    text = _SPACES.sub(" ", str(text or "").strip()).casefold()
+    return text.translate(_LOOKALIKES)
+
+
+def _decimal(normalized):
+    """Значение десятичного числа (Fraction) или None, если ответ — не такое число."""
+    if not _DECIMAL.match(normalized):
+        return None
+    return Fraction(normalized.replace(",", "."))
+
+
+def _fraction(normalized, reduced=False):
+    """
+    Значение дроби "p/q" (Fraction) или None, если ответ — не дробь.
+    reduced=True — только несократимая дробь.
+    """
+    match = _FRACTION.match(normalized)
+    if match is None:
+        return None
+    numerator, denominator = int(match.group(1)), int(match.group(2))
+    if reduced and gcd(numerator, denominator) != 1:
+        return None
+    return Fraction(normalized)
+
+
+class AnswerKey:
+    """Разобранный ключ ответа: допустимые строки, десятичные числа и дроби."""
+
+    __slots__ = ("source", "accepted", "numbers", "fractions")
+
+    def __init__(self, source):
+        self.source = source
+        # пустой вариант (нет ключа, "a||b") не засчитывает пустой ответ
+        variants = [v for v in (normalize_answer(v) for v in str(source or "").split(ALTERNATIVES_SEPARATOR)) if v]
+        self.accepted = frozenset(variants)
+        self.numbers = frozenset(n for n in map(_decimal, variants) if n is not None)
+        self.fractions = frozenset(f for f in map(_fraction, variants) if f is not None)
+
+    def check(self, text):
+        """Верен ли ответ text."""
+        normalized = normalize_answer(text)
+        if normalized in self.accepted:
+            return True
+        if self.numbers:
+            number = _decimal(normalized)
+            if number is not None and number in self.numbers:
+                return True
+        if self.fractions:
+            fraction = _fraction(normalized, reduced=True)
+            if fraction is not None and fraction in self.fractions:
+                return True
+        return False
+
+    def __repr__(self):
+        return f"<AnswerKey {self.source!r}>"
+
+
+# (task_id, example_id) -> AnswerKey; example_id None — ключ задачи целиком
+_keys = {}
+
+
+def compile_keys(tournament):
+    """Разбирает ключи всех задач и примеров турнира (TournamentInfo)."""
+    for block in tournament.blocks:
+        for task in block.tasks:
+            _keys[(task.id, None)] = AnswerKey(task.correct_answer)
+            for example in task.examples:
+                _keys[(task.id, example.id)] = AnswerKey(example.correct_answer)
+
+
+def forget_keys(tournament):
+    """Сбрасывает ключи задач турнира (TournamentInfo) — при смене его содержимого."""
+    for block in tournament.blocks:
+        for task in block.tasks:
+            _keys.pop((task.id, None), None)
+            for example in task.examples:
+                _keys.pop((task.id, example.id), None)
+
+
+def answer_key(task, example=None):
+    """AnswerKey задачи (TaskInfo) или её примера (ExampleInfo)."""
+    example_id = example.id if example is not None else None
+    source = (example if example is not None else task).correct_answer
+    key = _keys.get((task.id, example_id))
+    if key is None or key.source != source:
+        # структура загружена мимо catalog или ключ разобран из прежней версии
+        key = _keys[(task.id, example_id)] = AnswerKey(source)
+    return key
+
+
+def grade(task, text, example=None):
+    """(верно ли, начисленные баллы) для ответа text на задачу или её пример."""
+    is_correct = answer_key(task, example).check(text)
+    points = (example if example is not None else task).points
+    return is_correct, (points or 0) if is_correct else 0
@@ -0,0 +1,144 @@
+# app/idempotency.py
+# Повторы POST-запросов команды (обрыв Wi-Fi, двойное нажатие) по заголовку
+# Idempotency-Key.
+#
+# Клиент генерирует ключ на одно действие и повторяет запрос с тем же ключом.
+# Ответ на первый запрос сохраняется в idempotency_keys (общей для всех
+# воркеров) в той же транзакции, что и записанные им ответы или старт блока
+# (commit_response), поэтому повтор видит либо и запись, и ответ, либо ничего, и
+# получает сохранённый ответ одним SELECT — без записи ответов, пересчёта очков и
+# проверки окончания блока. Запоминаются только ответы, прошедшие через
+# commit_response; ошибки валидации при повторе просто получаются снова. Запросы
+# без заголовка работают как раньше. Два одновременных дубля оба выполняются
+# (запись ответов и старт блока сами по себе безопасны при повторе, см.
+# ON CONFLICT), сохраняется первый.
+#
+# Хранилище ограничено при записи: commit_response в той же транзакции удаляет
+# истёкшие ключи команды и всё сверх её последних IDEMPOTENCY_KEYS_PER_TEAM —
+# не больше IDEMPOTENCY_KEYS_PER_TEAM строк по индексу (team_id, key), даже без
+# планировщика (BLOCK_EXPIRY_SCHEDULER=0). Истёкшие ключи команд, которые больше
+# ничего не отправляют, дочищает планировщик (prune_idempotency_keys).
+from datetime import datetime, timezone, timedelta
+from functools import wraps
+from flask import current_app, g, jsonify, make_response, request
+from flask_login import current_user
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .extensions import db
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = 10 * 60          # секунд
+IDEMPOTENCY_KEYS_PER_TEAM = 50
+IDEMPOTENCY_PRUNE_BATCH = 1000
+
+
+def commit_response(response):
+    """
+    Commit транзакции обработчика. Если запрос пришёл с Idempotency-Key, ответ
+    записывается в эту же транзакцию. Возвращает response (как make_response).
+    """
+    response = make_response(response)
+    pending = g.pop("idempotency_key", None)
+    if pending is not None and response.status_code < 500 and response.mimetype == "application/json":
+        team_id, key, now = pending
+        values = {
+            "path": request.path,
+            "status": response.status_code,
+            "body": response.get_data(as_text=True),
+            "created_at": now,
+        }
+        db.session.execute(
+            pg_insert(IdempotencyKey).values(team_id=team_id, key=key, **values).on_conflict_do_update(
+                constraint="uq_idempotency_keys_team_key",
+                set_=values,
+                # живой ключ не перезаписываем: его ответ уже отдан
+                where=IdempotencyKey.created_at < now - timedelta(seconds=IDEMPOTENCY_TTL),
+            )
+        )
+        _prune_team_keys(team_id, now)
+    db.session.commit()
+    return response
+
+
+def _fresh_first():
+    # ключ, перезаписанный после истечения, сохраняет старый id — порядок по времени
+    return IdempotencyKey.created_at.desc(), IdempotencyKey.id.desc()
+
+
+def _prune_team_keys(team_id, now):
+    """Удаляет истёкшие ключи команды и ключи сверх последних IDEMPOTENCY_KEYS_PER_TEAM."""
+    kept = select(IdempotencyKey.id).where(
+        IdempotencyKey.team_id == team_id,
+        IdempotencyKey.created_at >= now - timedelta(seconds=IDEMPOTENCY_TTL),
+    ).order_by(*_fresh_first()).limit(IDEMPOTENCY_KEYS_PER_TEAM)
+    db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.team_id == team_id, IdempotencyKey.id.not_in(kept))
+    )
+
+
+def prune_idempotency_keys(now=None):
+    """
+    Удаляет истёкшие ключи и ключи сверх последних IDEMPOTENCY_KEYS_PER_TEAM
+    каждой команды — пачками по IDEMPOTENCY_PRUNE_BATCH, с commit после каждой.
+    Возвращает число удалённых.
+    """
+    now = now or datetime.now(timezone.utc)
+    expired = IdempotencyKey.created_at < now - timedelta(seconds=IDEMPOTENCY_TTL)
+    ranked = select(
+        IdempotencyKey.id,
+        expired.label("expired"),
+        # места по свежести среди живых ключей команды; истёкшие — после них
+        func.row_number().over(
+            partition_by=IdempotencyKey.team_id, order_by=(expired, *_fresh_first())
+        ).label("n"),
+    ).subquery()
+    stale = select(ranked.c.id).where(
+        ranked.c.expired | (ranked.c.n > IDEMPOTENCY_KEYS_PER_TEAM)
+    ).limit(IDEMPOTENCY_PRUNE_BATCH)
+
+    total = 0
+    while True:
+        deleted = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id.in_(stale))).rowcount
+        db.session.commit()
+        total += deleted
+        if deleted < IDEMPOTENCY_PRUNE_BATCH:
+            return total
+
+
+def idempotent(view):
+    """
+    Декоратор POST-обработчика команды (после login_required): повтор запроса с
+    тем же Idempotency-Key в течение IDEMPOTENCY_TTL получает сохранённый ответ.
+    Обработчик завершает запись через commit_response.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not current_user.is_authenticated:
+            return view(*args, **kwargs)
+        if len(key) > 100:
+            return jsonify({"ok": False, "error": "Idempotency-Key too long"}), 400
+
+        team_id = current_user.id
+        now = datetime.now(timezone.utc)
+        stored = db.session.query(IdempotencyKey.path, IdempotencyKey.status, IdempotencyKey.body).filter(
+            IdempotencyKey.team_id == team_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.created_at >= now - timedelta(seconds=IDEMPOTENCY_TTL),
+        ).first()
+        if stored is not None:
+            if stored.path != request.path:
+                return jsonify({"ok": False, "error": "Idempotency-Key already used for another request"}), 422
+            response = current_app.response_class(stored.body, status=stored.status, mimetype="application/json")
+            response.headers["Idempotent-Replayed"] = "true"
+            return response
+
+        # ответ запишет commit_response обработчика
+        g.idempotency_key = (team_id, key, now)
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.pop("idempotency_key", None)
+
+    return wrapper
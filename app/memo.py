@@ -0,0 +1,82 @@
+# app/memo.py
+# Кеш на время одного запроса (flask.g): время блоков команды. Сбрасывается сам,
+# когда в этом же запросе записываются ответы или начала блоков (after_flush сессии).
+# Структура турниров кешируется дольше — на уровне воркера (app/catalog.py).
+#
+# Счётчики попаданий/промахов — в g; при MEMO_DEBUG=1 они уходят в заголовок
+# X-Memo каждого ответа.
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .models import Answer, Task, TaskBlock, TaskExample, TeamBlockStart, Tournament
+
+# какие записи сбрасывают какие виды кеша
+_INVALIDATES = (
+    ((Answer, TeamBlockStart, Tournament, TaskBlock, Task, TaskExample), ("timeline",)),
+)
+
+
+def _store():
+    if "memo" not in g:
+        g.memo = {}
+        g.memo_stats = {"hits": 0, "misses": 0}
+    return g.memo
+
+
+def cached(kind, key, load):
+    """Значение load() для (kind, key), посчитанное не больше одного раза за запрос."""
+    if not has_app_context():
+        return load()
+    store = _store()
+    if (kind, key) in store:
+        g.memo_stats["hits"] += 1
+        return store[(kind, key)]
+    g.memo_stats["misses"] += 1
+    value = store[(kind, key)] = load()
+    return value
+
+
+def invalidate(*kinds):
+    """Сбрасывает кеш запроса: указанные виды или всё."""
+    if not has_app_context() or "memo" not in g:
+        return
+    if not kinds:
+        g.memo.clear()
+        return
+    for key in [k for k in g.memo if k[0] in kinds]:
+        del g.memo[key]
+
+
+def stats():
+    """{"hits": n, "misses": n} текущего запроса."""
+    if not has_app_context() or "memo" not in g:
+        return {"hits": 0, "misses": 0}
+    return dict(g.memo_stats)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_on_write(session, flush_context):
+    if not has_app_context() or "memo" not in g:
+        return
+    written = list(session.new) + list(session.dirty) + list(session.deleted)
+    for models, kinds in _INVALIDATES:
+        if any(isinstance(obj, models) for obj in written):
+            invalidate(*kinds)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_bulk_write(orm_execute_state):
+    # массовые UPDATE/DELETE (admin-сбросы, bump версии) и INSERT ... ON CONFLICT идут мимо flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        invalidate()
+
+
+def init_app(app):
+    if not app.config.get("MEMO_DEBUG"):
+        return
+
+    @app.after_request
+    def _memo_header(response):
+        s = stats()
+        response.headers["X-Memo"] = f"hits={s['hits']}; misses={s['misses']}"
+        return response
@@ -5,7 +5,10 @@ from enum import Enum
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from sqlalchemy.dialects.postgresql import ENUM as PgEnum
-from sqlalchemy import UniqueConstraint, Index, text
+from sqlalchemy import UniqueConstraint, Index, text, case, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+from sqlalchemy.orm.attributes import set_committed_value
 
 class Team(db.Model):
     __tablename__ = "teams"
@@ -113,9 +116,14 @@ class Answer(db.Model):
 
     # SQLAlchemy-level unique constraints:
     # - уникальность для пар (team_id, task_id, example_id) — защищает дублирование по конкретному примеру
-    # - для whole-task (example_id IS NULL) мы создадим partial index (см. миграции/SQL)
+    # - для whole-task (example_id IS NULL) — partial unique index: NULL в constraint не сравниваются
+    # оба — цели ON CONFLICT в scoreboard.upsert_answers
     __table_args__ = (
         UniqueConstraint("team_id", "task_id", "example_id", name="uq_answers_team_task_example"),
+        Index(
+            "uq_answers_team_task_whole", "team_id", "task_id",
+            unique=True, postgresql_where=text("example_id IS NULL"),
+        ),
     )
 
 
@@ -128,6 +136,14 @@ class Tournament(db.Model):
     # группа/класс — произвольная метка
     group = db.Column(db.String(32), nullable=True, index=True)
 
+    # версия результатов: растёт при каждом изменении ответов/старте блока,
+    # по ней кешируются таблицы результатов (см. app/snapshots.py)
+    score_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # версия содержимого (блоки, задачи, примеры, ответы-ключи): растёт при изменении
+    # структуры из админки, по ней кешируется структура турнира (см. app/catalog.py)
+    content_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
 
 class TaskBlock(db.Model):
     __tablename__ = "task_blocks"
@@ -144,6 +160,9 @@ class TaskBlock(db.Model):
     order = db.Column(db.Integer, nullable=False)  # порядок блока в турнире
     max_duration = db.Column(db.Integer, nullable=False)  # максимальная длительность в секундах
     image_url = db.Column(db.String(500), nullable=True)   # картинка для отображения в правом нижнем углу
+    # сколько ответов закрывает блок: по одному на обычную задачу и на каждый пример;
+    # пересчитывается при любом изменении задач/примеров (см. _refresh_required_slots)
+    required_slots = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
     tournament = db.relationship("Tournament", backref=db.backref("blocks", order_by="TaskBlock.order", lazy=True))
 
@@ -152,21 +171,142 @@ class TeamBlockStart(db.Model):
     Время начала блока для конкретной команды.
     Устанавливается когда команда нажимает кнопку "Начать следующий блок".
     """
-    tablename = "team_block_starts"
+    __tablename__ = "team_block_start"
     
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey("teams.id"), nullable=False)
     block_id = db.Column(db.Integer, db.ForeignKey("task_blocks.id"), nullable=False)
     started_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+    # время окончания блока: последний нужный ответ или истечение max_duration;
+    # записывается один раз (см. utils.TeamTimeline)
+    finished_at = db.Column(db.DateTime(timezone=True), nullable=True)
     
     team = db.relationship("Team", backref=db.backref("block_starts", lazy="dynamic"))
     block = db.relationship("TaskBlock", backref=db.backref("team_starts", lazy="dynamic"))
     
-    table_args = (
+    # одна запись на (команда, блок): start_block и finish_team_block пишут через ON CONFLICT
+    __table_args__ = (
         UniqueConstraint("team_id", "block_id", name="uq_team_block_start"),
     )
 
+
+class TeamScore(db.Model):
+    """
+    Агрегат очков команды по задаче (сумма по ответам, число ответов и верных).
+    Обновляется в api_post_task в той же транзакции, что и Answer
+    (см. app/scoreboard.py), чтобы таблицы результатов читали одну строку
+    на (команда, задача), а не сканировали answers.
+    """
+    __tablename__ = "team_scores"
+
+    team_id = db.Column(db.Integer, db.ForeignKey("teams.id"), primary_key=True)
+    task_id = db.Column(db.Integer, db.ForeignKey("tasks.id"), primary_key=True)
+
+    # денормализовано из tasks/task_blocks для выборки по турниру/блоку без join
+    block_id = db.Column(db.Integer, db.ForeignKey("task_blocks.id"), nullable=False)
+    tournament_id = db.Column(db.Integer, db.ForeignKey("tournaments.id"), nullable=False)
+
+    points = db.Column(db.Integer, nullable=False, default=0)
+    answered = db.Column(db.Integer, nullable=False, default=0)  # для examples — число отвеченных примеров
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        Index("ix_team_scores_tournament_team", "tournament_id", "team_id"),
+        Index("ix_team_scores_block", "block_id"),
+    )
+
+class ScoreboardSnapshot(db.Model):
+    """
+    Сериализованная таблица результатов турнира для конкретной score_version.
+    Общая для всех воркеров gunicorn; хранится несколько последних версий.
+    key — вид таблицы: "overall", "teams", "block:<id>".
+    """
+    __tablename__ = "scoreboard_snapshots"
+
+    tournament_id = db.Column(db.Integer, db.ForeignKey("tournaments.id"), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+
+class FinalResult(db.Model):
+    """
+    Итоговые таблицы завершённого турнира (все команды прошли все блоки).
+    Не меняются; удаляются только при изменении результатов из админки.
+    key — как в ScoreboardSnapshot, плюс "full".
+    """
+    __tablename__ = "final_results"
+
+    tournament_id = db.Column(db.Integer, db.ForeignKey("tournaments.id"), primary_key=True)
+    key = db.Column(db.String(64), primary_key=True)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+
+class IdempotencyKey(db.Model):
+    """
+    Ответ на POST команды с заголовком Idempotency-Key: повтор запроса с тем же
+    ключом получает сохранённый ответ, а не выполняется заново (app/idempotency.py).
+    Живёт IDEMPOTENCY_TTL секунд; на команду хранится не больше IDEMPOTENCY_KEYS_PER_TEAM.
+    """
+    __tablename__ = "idempotency_keys"
+
+    id = db.Column(db.Integer, primary_key=True)
+    team_id = db.Column(db.Integer, db.ForeignKey("teams.id", ondelete="CASCADE"), nullable=False)
+    key = db.Column(db.String(100), nullable=False)
+    path = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        UniqueConstraint("team_id", "key", name="uq_idempotency_keys_team_key"),
+    )
+
+def required_slots_sql(block_id):
+    """SQL-выражение: сколько ответов закрывает блок block_id (по текущим задачам и примерам)."""
+    n_examples = select(func.count(TaskExample.id)).where(TaskExample.task_id == Task.id).scalar_subquery()
+    return select(
+        func.coalesce(func.sum(case((Task.type == "examples", n_examples), else_=1)), 0)
+    ).where(Task.block_id == block_id).scalar_subquery()
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_required_slots(session, flush_context):
+    """Пересчитывает TaskBlock.required_slots для блоков, у которых менялись задачи или примеры."""
+    block_ids, task_ids = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Task):
+            block_ids.update(b for b in inspect(obj).attrs.block_id.history.sum() if b is not None)
+            block_ids.add(obj.block_id)
+        elif isinstance(obj, TaskExample):
+            task_ids.update(t for t in inspect(obj).attrs.task_id.history.sum() if t is not None)
+            task_ids.add(obj.task_id)
+    if task_ids:
+        block_ids.update(session.execute(select(Task.block_id).where(Task.id.in_(task_ids))).scalars())
+    block_ids.discard(None)
+    if not block_ids:
+        return
+
+    rows = session.execute(
+        update(TaskBlock)
+        .where(TaskBlock.id.in_(block_ids))
+        .values(required_slots=required_slots_sql(TaskBlock.id))
+        .returning(TaskBlock.id, TaskBlock.required_slots)
+    ).all()
+    # загруженные в сессию блоки получают новое значение без лишнего UPDATE
+    for block_id, n in rows:
+        block = session.identity_map.get(identity_key(TaskBlock, block_id))
+        if block is not None:
+            set_committed_value(block, "required_slots", n)
+
+
 def reset_db():
+    FinalResult.query.delete()
+    ScoreboardSnapshot.query.delete()
+    TeamScore.query.delete()
     Answer.query.delete()
     TaskExample.query.delete()
     Task.query.delete()
@@ -0,0 +1,101 @@
+# app/ranking.py
+from bisect import bisect_left, bisect_right, insort
+
+
+class Ranking:
+    """
+    Места команд с учётом ничьих ("1", "2-4", ...).
+    Хранит отсортированный список ключей (-total, name, team_id): место и диапазон
+    ничьей для команды ищутся бинарным поиском за O(log n). Изменение очков одной
+    команды — бинарный поиск и сдвиг хвоста списка (memmove указателей, O(n), но
+    без сравнений), а не пересортировка всей таблицы.
+
+    update/remove меняют объект на месте и не защищены от одновременного
+    чтения: общий для потоков Ranking не изменяют, а меняют его copy() и
+    подменяют ссылку (см. scoreboard.tournament_ranking).
+    """
+
+    def __init__(self, entries=()):
+        # entries: итерируемое (team_id, total, name)
+        self._key_by_team = {team_id: (-total, name or "", team_id) for team_id, total, name in entries}
+        self._keys = sorted(self._key_by_team.values())
+
+    def copy(self):
+        """Независимая копия: её изменения не видны читателям исходного объекта."""
+        clone = Ranking.__new__(Ranking)
+        clone._key_by_team = dict(self._key_by_team)
+        clone._keys = list(self._keys)
+        return clone
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, team_id):
+        return team_id in self._key_by_team
+
+    def update(self, team_id, total, name):
+        """Добавляет команду или меняет её очки/название."""
+        key = (-total, name or "", team_id)
+        old = self._key_by_team.get(team_id)
+        if old == key:
+            return
+        if old is not None:
+            del self._keys[bisect_left(self._keys, old)]
+        insort(self._keys, key)
+        self._key_by_team[team_id] = key
+
+    def remove(self, team_id):
+        old = self._key_by_team.pop(team_id, None)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, old)]
+
+    def total(self, team_id):
+        return -self._key_by_team[team_id][0]
+
+    def position(self, team_id):
+        """Индекс команды в таблице (0 — первая строка)."""
+        return bisect_left(self._keys, self._key_by_team[team_id])
+
+    def tie_range(self, team_id):
+        """(первое место, последнее место) среди команд с теми же очками, с 1."""
+        score = self._key_by_team[team_id][0]
+        lo = bisect_left(self._keys, score, key=lambda k: k[0])
+        hi = bisect_right(self._keys, score, key=lambda k: k[0])
+        return lo + 1, hi
+
+    def label(self, team_id):
+        lo, hi = self.tie_range(team_id)
+        return str(lo) if lo == hi else f"{lo}-{hi}"
+
+    def ordered(self):
+        """id команд в порядке таблицы."""
+        return [key[2] for key in self._keys]
+
+    def labels(self):
+        """team_id -> метка места для всей таблицы за один проход."""
+        out = {}
+        n = len(self._keys)
+        i = 0
+        while i < n:
+            j = bisect_right(self._keys, self._keys[i][0], lo=i, key=lambda k: k[0])
+            label = str(i + 1) if j - i == 1 else f"{i + 1}-{j}"
+            for k in range(i, j):
+                out[self._keys[k][2]] = label
+            i = j
+        return out
+
+
+def rank_rows(rows, label_field="rank_label", id_field="team_id", name_field="team_name"):
+    """
+    Упорядочивает строки таблицы по (-total, название) и проставляет метки мест.
+    Сортирует список на месте и возвращает его. Это полная сортировка — для
+    сборки таблиц, которые строятся раз на версию результатов (app/snapshots.py);
+    место одной команды дешевле брать из tournament_ranking.
+    """
+    ranking = Ranking((r[id_field], r["total"], r[name_field]) for r in rows)
+    labels = ranking.labels()
+    index = {team_id: i for i, team_id in enumerate(ranking.ordered())}
+    rows.sort(key=lambda r: index[r[id_field]])
+    for r in rows:
+        r[label_field] = labels[r[id_field]]
+    return rows
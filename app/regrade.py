@@ -0,0 +1,90 @@
+# app/regrade.py
+# Перепроверка сохранённых ответов после исправления ключа (correct_answer).
+#
+# Ответы читаются потоком (серверный курсор, yield_per) пачками по REGRADE_CHUNK
+# строк и проверяются теми же AnswerKey, что и при отправке (app/grading.py).
+# Изменившиеся оценки записываются одним UPDATE ... FROM unnest(...) на пачку,
+# затем team_scores затронутых задач пересчитываются одним INSERT ... SELECT.
+# Всё — в одной транзакции вместе с bump версий: кеш структуры и ключей во
+# всех воркерах, таблицы результатов и итоги турнира сбрасываются после commit.
+from sqlalchemy import select, text
+from .catalog import bump_content_version, tournament_structure
+from .extensions import db
+from .grading import answer_key
+from .models import Answer
+from .scoreboard import rebuild_task_scores
+from .snapshots import bump_score_version
+
+REGRADE_CHUNK = 5000
+
+
+# новые оценки пачки — тремя массивами: текст запроса один и тот же при любом
+# размере пачки (VALUES на тысячи строк SQLAlchemy компилировал бы дольше, чем
+# PostgreSQL его выполняет)
+_WRITE_GRADES = text("""
+    UPDATE answers AS a
+    SET is_correct = graded.is_correct, points = graded.points
+    FROM unnest(CAST(:ids AS integer[]), CAST(:correct AS boolean[]), CAST(:points AS integer[]))
+         AS graded(id, is_correct, points)
+    WHERE a.id = graded.id
+""")
+
+
+def _write_grades(changed):
+    ids, correct, points = zip(*changed)
+    db.session.execute(_WRITE_GRADES, {"ids": list(ids), "correct": list(correct), "points": list(points)})
+
+
+def regrade_answers(tournament_id, task_ids=None):
+    """
+    Перепроверяет ответы на задачи task_ids турнира (None — на все его задачи)
+    по текущим ключам из БД. Вызывающий делает commit.
+    Возвращает {"tasks": n, "answers": n, "changed": n} или None, если турнира нет.
+    """
+    # ключи могли поправить прямо в БД — перечитываем структуру во всех воркерах
+    bump_content_version(tournament_id)
+    tournament = tournament_structure(tournament_id)
+    if tournament is None:
+        return None
+
+    tasks = [task for block in tournament.blocks for task in block.tasks]
+    if task_ids is not None:
+        task_ids = set(task_ids)
+        tasks = [task for task in tasks if task.id in task_ids]
+    by_id = {task.id: task for task in tasks}
+
+    # ключ слота (task_id, example_id) -> (AnswerKey, баллы за верный ответ)
+    slots = {}
+    for task in tasks:
+        slots[(task.id, None)] = (answer_key(task), task.points or 0)
+        for example in task.examples:
+            slots[(task.id, example.id)] = (answer_key(task, example), example.points or 0)
+
+    total = changed_total = 0
+    if by_id:
+        result = db.session.execute(
+            select(Answer.id, Answer.task_id, Answer.example_id, Answer.answer_text, Answer.is_correct, Answer.points)
+            .where(Answer.task_id.in_(list(by_id)))
+            .execution_options(yield_per=REGRADE_CHUNK)
+        )
+        for chunk in result.partitions():
+            changed = []
+            for answer_id, task_id, example_id, answer_text, was_correct, old_points in chunk:
+                slot = slots.get((task_id, example_id))
+                if slot is None:
+                    continue
+                key, points = slot
+                is_correct = key.check(answer_text)
+                awarded = points if is_correct else 0
+                if is_correct != was_correct or awarded != old_points:
+                    changed.append((answer_id, is_correct, awarded))
+            total += len(chunk)
+            if changed:
+                _write_grades(changed)
+                changed_total += len(changed)
+        result.close()
+
+    if changed_total:
+        rebuild_task_scores(tasks)
+        bump_score_version(tournament_id)
+    return {"tasks": len(tasks), "answers": total, "changed": changed_total}
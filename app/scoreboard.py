@@ -0,0 +1,471 @@
+# app/scoreboard.py
+import threading
+from datetime import datetime, timezone
+from sqlalchemy import func, and_, or_, literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .events import add_listener, SCOREBOARD_CHANNEL
+from .extensions import db
+from .models import Answer, Task, TaskBlock, Team, TeamScore
+from .ranking import Ranking, rank_rows
+
+
+def upsert_answers(team_id, rows, only_missing=False):
+    """
+    Записывает ответы команды: не больше двух INSERT ... ON CONFLICT, сколько бы
+    задач и примеров ни было. rows — [(task_id, example_id, answer_text, is_correct, points)];
+    example_id None — ответ на задачу целиком. Повторная отправка перезаписывает
+    текст и оценку, время первой отправки (submitted_at) сохраняется; с
+    only_missing=True уже данные ответы не трогаются. Вызывать до refresh_team_scores.
+    """
+    # один слот дважды в одной отправке — побеждает последний ответ
+    # (ON CONFLICT не может обновить одну строку дважды за оператор)
+    latest = {}
+    for task_id, example_id, answer_text, is_correct, points in rows:
+        latest[(task_id, example_id)] = (answer_text, is_correct, points)
+    if not latest:
+        return
+
+    now = datetime.now(timezone.utc)
+    whole, per_example = [], []
+    for (task_id, example_id), (answer_text, is_correct, points) in latest.items():
+        (whole if example_id is None else per_example).append({
+            "team_id": team_id,
+            "task_id": task_id,
+            "example_id": example_id,
+            "answer_text": answer_text,
+            "is_correct": is_correct,
+            "points": points,
+            "submitted_at": now,
+        })
+
+    # у ответов на задачу целиком и на примеры разные уникальные индексы
+    for values, target in (
+        (whole, {"index_elements": [Answer.team_id, Answer.task_id], "index_where": Answer.example_id.is_(None)}),
+        (per_example, {"constraint": "uq_answers_team_task_example"}),
+    ):
+        if not values:
+            continue
+        stmt = pg_insert(Answer).values(values)
+        if only_missing:
+            stmt = stmt.on_conflict_do_nothing(**target)
+        else:
+            stmt = stmt.on_conflict_do_update(set_={
+                "answer_text": stmt.excluded.answer_text,
+                "is_correct": stmt.excluded.is_correct,
+                "points": stmt.excluded.points,
+            }, **target)
+        db.session.execute(stmt)
+
+
+def refresh_team_scores(team_id, tasks):
+    """
+    Пересчитывает строки team_scores команды по задачам tasks (TaskInfo) по answers:
+    один GROUP BY и один upsert. Вызывается после изменения ответов, но до commit —
+    агрегат попадает в ту же транзакцию, что и сами ответы.
+    """
+    tasks = {task.id: task for task in tasks}
+    if not tasks:
+        return
+    # autoflush выключен (см. extensions.py) — иначе агрегат не увидит новые ответы
+    db.session.flush()
+
+    examples_ids = [task_id for task_id, task in tasks.items() if task.type == "examples"]
+    single_ids = [task_id for task_id, task in tasks.items() if task.type != "examples"]
+    totals = {
+        task_id: (points, answered, correct)
+        for task_id, points, answered, correct in db.session.query(
+            Answer.task_id,
+            func.coalesce(func.sum(Answer.points), 0),
+            func.count(Answer.id),
+            func.count(Answer.id).filter(Answer.is_correct.is_(True)),
+        ).filter(
+            Answer.team_id == team_id,
+            or_(
+                and_(Answer.task_id.in_(examples_ids), Answer.example_id.isnot(None)),
+                and_(Answer.task_id.in_(single_ids), Answer.example_id.is_(None)),
+            ),
+        ).group_by(Answer.task_id)
+    }
+
+    now = datetime.now(timezone.utc)
+    stmt = pg_insert(TeamScore).values([
+        {
+            "team_id": team_id,
+            "task_id": task.id,
+            "block_id": task.block_id,
+            "tournament_id": task.block.tournament_id,
+            "points": int(points or 0),
+            "answered": int(answered or 0),
+            "correct": int(correct or 0),
+            "updated_at": now,
+        }
+        for task in tasks.values()
+        for points, answered, correct in [totals.get(task.id, (0, 0, 0))]
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TeamScore.team_id, TeamScore.task_id],
+        set_={
+            "points": stmt.excluded.points,
+            "answered": stmt.excluded.answered,
+            "correct": stmt.excluded.correct,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.session.execute(stmt)
+
+
+def rebuild_task_scores(tasks):
+    """
+    Пересчитывает team_scores всех команд по задачам tasks (TaskInfo) одним
+    INSERT ... SELECT ... ON CONFLICT — после массовой перепроверки ответов.
+    """
+    examples_ids = [task.id for task in tasks if task.type == "examples"]
+    single_ids = [task.id for task in tasks if task.type != "examples"]
+    if not examples_ids and not single_ids:
+        return
+
+    now = datetime.now(timezone.utc)
+    select_scores = db.session.query(
+        Answer.team_id,
+        Answer.task_id,
+        Task.block_id,
+        TaskBlock.tournament_id,
+        func.coalesce(func.sum(Answer.points), 0),
+        func.count(Answer.id),
+        func.count(Answer.id).filter(Answer.is_correct.is_(True)),
+        literal(now),
+    ).join(Task, Task.id == Answer.task_id).join(TaskBlock, TaskBlock.id == Task.block_id).filter(
+        or_(
+            and_(Answer.task_id.in_(examples_ids), Answer.example_id.isnot(None)),
+            and_(Answer.task_id.in_(single_ids), Answer.example_id.is_(None)),
+        ),
+    ).group_by(Answer.team_id, Answer.task_id, Task.block_id, TaskBlock.tournament_id)
+
+    stmt = pg_insert(TeamScore).from_select(
+        ["team_id", "task_id", "block_id", "tournament_id", "points", "answered", "correct", "updated_at"],
+        select_scores,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[TeamScore.team_id, TeamScore.task_id],
+        set_={
+            "points": stmt.excluded.points,
+            "answered": stmt.excluded.answered,
+            "correct": stmt.excluded.correct,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.session.execute(stmt)
+
+
+def refresh_team_score(team_id, task):
+    """Пересчитывает строку team_scores для пары (команда, задача); см. refresh_team_scores."""
+    refresh_team_scores(team_id, [task])
+
+
+def overall_rows(tournament):
+    """
+    Строки общей таблицы (без сортировки и мест): очки команды по каждому блоку.
+    Один запрос команд и один GROUP BY по team_scores — не зависит от числа задач.
+    tournament — TournamentInfo (см. app/catalog.py).
+    """
+    blocks = list(tournament.blocks)
+    teams = Team.query.filter_by(tournament_id=tournament.id).order_by(Team.name).all()
+
+    per_block = {}
+    aggregates = db.session.query(
+        TeamScore.team_id,
+        TeamScore.block_id,
+        func.sum(TeamScore.points),
+        func.sum(TeamScore.answered),
+    ).filter(
+        TeamScore.tournament_id == tournament.id
+    ).group_by(TeamScore.team_id, TeamScore.block_id).all()
+    for team_id, block_id, points, answered in aggregates:
+        per_block[(team_id, block_id)] = (int(points or 0), int(answered or 0))
+
+    rows = []
+    for team in teams:
+        cells = []
+        total = 0
+        for block in blocks:
+            pts_block, answered = per_block.get((team.id, block.id), (0, 0))
+            cells.append({"points": pts_block, "answered": answered > 0})
+            total += pts_block
+        rows.append(_team_row(team, cells, total))
+    return rows
+
+
+def _team_row(team, cells, total):
+    return {
+        "team_id": team.id,
+        "team_name": team.name or f"Team #{team.id}",
+        "member1": team.member1,
+        "member2": team.member2,
+        "member3": team.member3,
+        "cells": cells,
+        "total": total
+    }
+
+
+def _answer_scope():
+    """
+    Какие ответы относятся к ячейке задачи: для examples — только ответы на примеры,
+    для обычных задач — только ответ на всю задачу (example_id IS NULL).
+    """
+    return or_(
+        and_(Task.type == "examples", Answer.example_id.isnot(None)),
+        and_(func.coalesce(Task.type, "single") != "examples", Answer.example_id.is_(None)),
+    )
+
+
+def _example_counts(tasks):
+    """task_id -> число примеров (из структуры турнира, без запросов)."""
+    return {t.id: len(t.examples) for t in tasks}
+
+
+def _answer_aggregates(task_ids, team_ids):
+    """
+    (team_id, task_id) -> (points, answered, correct) одним GROUP BY по answers ⋈ tasks.
+    Фильтр и по командам турнира: индекс uq_answers_team_task_example начинается
+    с team_id, и без него answers читались бы целиком — со всеми турнирами.
+    """
+    if not task_ids or not team_ids:
+        return {}
+    rows = db.session.query(
+        Answer.team_id,
+        Answer.task_id,
+        func.coalesce(func.sum(Answer.points), 0),
+        func.count(Answer.id),
+        func.count(Answer.id).filter(Answer.is_correct.is_(True)),
+    ).join(
+        Task, Task.id == Answer.task_id
+    ).filter(
+        Answer.team_id.in_(team_ids),
+        Answer.task_id.in_(task_ids),
+        _answer_scope(),
+    ).group_by(Answer.team_id, Answer.task_id).all()
+    return {
+        (team_id, task_id): (int(points or 0), int(answered or 0), int(correct or 0))
+        for team_id, task_id, points, answered, correct in rows
+    }
+
+
+def _cell(task, n_examples, aggregate):
+    """Состояние ячейки (no-answer/correct/partial/wrong) и очки по агрегату ответов."""
+    points, answered, correct = aggregate or (0, 0, 0)
+    if task.type == "examples":
+        if not answered or not n_examples:
+            return {"state": "no-answer", "points": None}
+        if correct >= n_examples:
+            return {"state": "correct", "points": points}
+        if correct > 0:
+            return {"state": "partial", "points": points}
+        return {"state": "wrong", "points": points}
+
+    if not answered:
+        return {"state": "no-answer", "points": None}
+    return {"state": "correct" if correct else "wrong", "points": points}
+
+
+def block_table(block):
+    """
+    Таблица блока: состояние и очки каждой ячейки (команда × задача), сумма и место.
+    block — BlockInfo (см. app/catalog.py); запросы: команды и GROUP BY по ответам.
+    Используется и API (/api/dashboard/block/<id>), и страницей /dashboard/<id>.
+    """
+    tasks = list(block.tasks)
+    teams = Team.query.filter_by(tournament_id=block.tournament_id).order_by(Team.name).all()
+
+    n_examples = _example_counts(tasks)
+    aggregates = _answer_aggregates([t.id for t in tasks], [team.id for team in teams])
+
+    return {"tasks": tasks, "rows": _block_rows(tasks, teams, n_examples, aggregates)}
+
+
+def _block_rows(tasks, teams, n_examples, aggregates):
+    rows = []
+    for team in teams:
+        cells = []
+        total = 0
+        for t in tasks:
+            cell = _cell(t, n_examples.get(t.id, 0), aggregates.get((team.id, t.id)))
+            total += cell["points"] or 0
+            cells.append(cell)
+        rows.append(_team_row(team, cells, total))
+    return rank_rows(rows)
+
+
+def tournament_tables(tournament):
+    """
+    Все таблицы турнира из одной матрицы ответов (команда × задача):
+    общая таблица и таблица каждого блока — согласованный снимок.
+    tournament — TournamentInfo (см. app/catalog.py), поэтому запросов два:
+    команды и один GROUP BY по ответам.
+    """
+    blocks = list(tournament.blocks)
+    tasks_by_block = {b.id: list(b.tasks) for b in blocks}
+    teams = Team.query.filter_by(tournament_id=tournament.id).order_by(Team.name).all()
+
+    tasks = [t for block_tasks in tasks_by_block.values() for t in block_tasks]
+    n_examples = _example_counts(tasks)
+    aggregates = _answer_aggregates([t.id for t in tasks], [team.id for team in teams])
+
+    block_tables = [
+        {"block": b, "tasks": tasks_by_block[b.id], "rows": _block_rows(tasks_by_block[b.id], teams, n_examples, aggregates)}
+        for b in blocks
+    ]
+
+    # общая таблица — суммы ячеек блоков; строки блока уже пересортированы, поэтому по team_id
+    by_team = [{r["team_id"]: r for r in bt["rows"]} for bt in block_tables]
+    overall = []
+    for team in teams:
+        cells = []
+        total = 0
+        for block_rows in by_team:
+            row = block_rows[team.id]
+            answered = any(c["state"] != "no-answer" for c in row["cells"])
+            cells.append({"points": row["total"], "answered": answered})
+            total += row["total"]
+        overall.append(_team_row(team, cells, total))
+
+    return {"blocks": block_tables, "overall": rank_rows(overall)}
+
+
+def block_json(block, tasks, rows):
+    """Таблица блока в виде ответа API."""
+    return {
+        "block": {"id": block.id, "name": block.name},
+        "tasks": [{"id": t.id, "title": t.title, "type": t.type, "points": getattr(t, "points", None)} for t in tasks],
+        "rows": rows
+    }
+
+
+def full_payload(tournament):
+    """Общая таблица и таблицы всех блоков турнира (ответ /api/dashboard/<id>/full)."""
+    tables = tournament_tables(tournament)
+    blocks = [bt["block"] for bt in tables["blocks"]]
+    return {
+        "tournament": {"id": tournament.id, "name": tournament.name},
+        "overall": {
+            "tournament": {"id": tournament.id, "name": tournament.name},
+            "blocks": [{"id": b.id, "name": b.name} for b in blocks],
+            "rows": tables["overall"]
+        },
+        "blocks": [block_json(bt["block"], bt["tasks"], bt["rows"]) for bt in tables["blocks"]],
+    }
+
+
+def diff_rows(prev_rows, rows, id_field="team_id"):
+    """
+    Изменения таблицы между двумя состояниями: изменившиеся строки (вместе с местом),
+    id удалённых команд и новый порядок команд — только если он поменялся.
+    """
+    prev = {r[id_field]: r for r in prev_rows}
+    ids = {r[id_field] for r in rows}
+    delta = {
+        "rows": [r for r in rows if prev.get(r[id_field]) != r],
+        "removed": [team_id for team_id in prev if team_id not in ids],
+    }
+    order = [r[id_field] for r in rows]
+    if order != [r[id_field] for r in prev_rows]:
+        delta["order"] = order
+    return delta
+
+
+# tournament_id -> (score_version, Ranking) — места по общей сумме в этом воркере.
+# Опубликованный здесь Ranking больше не меняется: потоки читают его без
+# блокировки, новая версия собирается в копии и подменяет запись целиком
+_rankings = {}
+_rankings_lock = threading.Lock()
+
+# tournament_id -> {score_version: frozenset(team_id) или None} — из событий
+# SCOREBOARD_CHANNEL: чьи очки изменила каждая версия после закешированной
+# (None — любые команды, например сброс из админки)
+_ranking_changes = {}
+
+# сколько версий после закешированной помнить; дальше — пересчёт всей таблицы
+RANKING_CHANGES_KEPT = 1000
+
+
+def _on_scoreboard_event(payload):
+    tournament_id, version = payload.get("k"), payload.get("v")
+    changes = _ranking_changes.get(tournament_id)
+    if changes is None or version is None or len(changes) >= RANKING_CHANGES_KEPT:
+        return
+    teams = payload.get("teams")
+    changes[version] = frozenset(teams) if teams is not None else None
+
+
+def _changed_teams(tournament_id, since, version):
+    """
+    id команд, чьи очки могли измениться в версиях since+1..version, или None,
+    если хотя бы одной версии нет в журнале (событие ещё не дошло, пропущено или
+    меняло любые команды).
+    """
+    changes = _ranking_changes.get(tournament_id) or {}
+    teams = set()
+    for v in range(since + 1, version + 1):
+        changed = changes.get(v)
+        if changed is None:
+            return None
+        teams |= changed
+    return teams
+
+
+def _team_totals(tournament_id, team_ids=None):
+    """[(team_id, name, сумма очков)] команд турнира; team_ids — только этих."""
+    query = db.session.query(
+        Team.id, Team.name, func.coalesce(func.sum(TeamScore.points), 0)
+    ).outerjoin(
+        TeamScore, TeamScore.team_id == Team.id
+    ).filter(
+        Team.tournament_id == tournament_id
+    )
+    if team_ids is not None:
+        query = query.filter(Team.id.in_(team_ids))
+    return query.group_by(Team.id, Team.name).all()
+
+
+def tournament_ranking(tournament_id, version):
+    """
+    Ranking турнира по сумме очков (из team_scores) для версии результатов version.
+
+    Если у воркера есть Ranking более ранней версии и журнал событий покрывает
+    все версии после неё, из БД читаются суммы только изменившихся команд (обычно
+    одной — той, что отправила ответ), и они переставляются в копии Ranking.
+    Иначе — одна группировка по всем командам турнира.
+    """
+    cached = _rankings.get(tournament_id)
+    if cached and cached[0] == version:
+        return cached[1]
+    # журнал изменений ведётся только для турниров, чьи места уже в памяти
+    add_listener(SCOREBOARD_CHANNEL, _on_scoreboard_event)
+
+    teams = None
+    if cached and cached[0] < version:
+        teams = _changed_teams(tournament_id, cached[0], version)
+    totals = _team_totals(tournament_id, teams) if teams is None or teams else []
+
+    if teams is None:
+        ranking = Ranking((team_id, int(total or 0), name or f"Team #{team_id}") for team_id, name, total in totals)
+    else:
+        ranking = cached[1].copy()
+        found = set()
+        for team_id, name, total in totals:
+            ranking.update(team_id, int(total or 0), name or f"Team #{team_id}")
+            found.add(team_id)
+        # удалённые команды
+        for team_id in teams - found:
+            ranking.remove(team_id)
+
+    with _rankings_lock:
+        current = _rankings.get(tournament_id)
+        if current and current[0] >= version:
+            return current[1] if current[0] == version else ranking
+        _rankings[tournament_id] = (version, ranking)
+        changes = _ranking_changes.setdefault(tournament_id, {})
+        # журнал пополняет поток-слушатель: list() снимает ключи за один шаг
+        for v in list(changes):
+            if v <= version:
+                changes.pop(v, None)
+    return ranking
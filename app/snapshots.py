@@ -0,0 +1,374 @@
+# app/snapshots.py
+# Кеш таблиц результатов, привязанный к Tournament.score_version.
+#
+# score_version увеличивается в той же транзакции, что и запись ответа или старт
+# блока, поэтому сериализованная таблица для версии v неизменна. Таблицы хранятся
+# в scoreboard_snapshots (общей для всех воркеров gunicorn) и дублируются в памяти
+# процесса; клиентам отдаётся ETag с версией, повторный опрос без изменений — 304.
+import threading
+import time
+import zlib
+from flask import abort, current_app, request
+from sqlalchemy import true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .catalog import tournament_structure
+from .events import add_listener, notify, SCOREBOARD_CHANNEL
+from .extensions import db
+from .memo import invalidate
+from .models import Tournament, ScoreboardSnapshot, FinalResult
+from .utils import is_tournament_finished
+
+# сколько последних версий каждой таблицы держим в БД
+SNAPSHOT_HISTORY = 20
+
+# (tournament_id, key) -> (version, json body) — кеш текущего воркера
+_local = {}
+
+# (tournament_id, key, since) -> (version, json body) — дельты текущего воркера
+_local_deltas = {}
+
+# (tournament_id, key) -> Lock: таблицу версии строит один поток воркера,
+# остальные ждут и берут готовый снимок
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+# сколько раз пересобирать таблицу, если версия сменилась во время сборки
+SNAPSHOT_BUILD_ATTEMPTS = 3
+
+# итоговые таблицы завершённых турниров: не чаще раза в FINAL_CHECK_INTERVAL секунд
+# воркер проверяет, не завершился ли турнир
+FINAL_CHECK_INTERVAL = 60
+
+_final = {}          # tournament_id -> {key: json body}
+_final_blocks = {}   # block_id -> tournament_id для замороженных турниров
+_final_checked = {}  # tournament_id -> time.monotonic() последней проверки
+_final_resets = {}   # tournament_id -> число bump, замеченных воркером
+
+
+def _bump(where, team_ids=None):
+    rows = db.session.execute(
+        update(Tournament)
+        .where(where)
+        .values(score_version=Tournament.score_version + 1)
+        .returning(Tournament.id, Tournament.score_version)
+    ).all()
+    for tournament_id, version in rows:
+        if team_ids is None:
+            notify(SCOREBOARD_CHANNEL, tournament_id, v=version)
+        else:
+            notify(SCOREBOARD_CHANNEL, tournament_id, v=version, teams=sorted(team_ids))
+    if rows:
+        # результаты изменились — итоговые таблицы больше не действительны
+        FinalResult.query.filter(
+            FinalResult.tournament_id.in_([tournament_id for tournament_id, _ in rows])
+        ).delete(synchronize_session=False)
+        for tournament_id, _ in rows:
+            _forget_final(tournament_id)
+    return rows
+
+
+def bump_score_version(tournament_id, team_ids=None):
+    """
+    Увеличивает версию результатов турнира. Вызывать до commit —
+    новая версия (и событие для SSE-потоков) станет видна вместе с изменёнными ответами.
+    team_ids — команды, чьи очки могли измениться (None — любые): по ним
+    воркеры обновляют места, не пересчитывая всю таблицу (scoreboard.tournament_ranking).
+    """
+    _bump(Tournament.id == tournament_id, team_ids)
+
+
+def bump_all_score_versions():
+    """То же для всех турниров — для массовых admin-операций."""
+    _bump(true())
+
+
+def current_score_version(tournament_id):
+    """Текущая версия результатов или None, если турнира нет."""
+    return db.session.query(Tournament.score_version).filter(Tournament.id == tournament_id).scalar()
+
+
+def etag_for(tournament_id, key, version):
+    return f"sb-{tournament_id}-{key}-{version}"
+
+
+def get_snapshot(tournament_id, key, version):
+    """JSON-строка таблицы для данной версии или None."""
+    cached = _local.get((tournament_id, key))
+    if cached and cached[0] == version:
+        return cached[1]
+
+    body = db.session.query(ScoreboardSnapshot.payload).filter_by(
+        tournament_id=tournament_id, key=key, version=version
+    ).scalar()
+    if body is not None:
+        _local[(tournament_id, key)] = (version, body)
+    return body
+
+
+def put_snapshot(tournament_id, key, version, body):
+    """Сохраняет таблицу версии version и удаляет слишком старые версии."""
+    _local[(tournament_id, key)] = (version, body)
+    db.session.execute(
+        pg_insert(ScoreboardSnapshot).values(
+            tournament_id=tournament_id, key=key, version=version, payload=body
+        ).on_conflict_do_nothing()
+    )
+    # храним SNAPSHOT_HISTORY последних сохранённых версий (а не номеров версий):
+    # в горячие минуты версия растёт быстрее, чем клиенты опрашивают сервер
+    oldest_kept = db.session.query(ScoreboardSnapshot.version).filter_by(
+        tournament_id=tournament_id, key=key
+    ).order_by(ScoreboardSnapshot.version.desc()).offset(SNAPSHOT_HISTORY - 1).limit(1).scalar()
+    if oldest_kept is not None:
+        ScoreboardSnapshot.query.filter(
+            ScoreboardSnapshot.tournament_id == tournament_id,
+            ScoreboardSnapshot.key == key,
+            ScoreboardSnapshot.version < oldest_kept,
+        ).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _build_lock(tournament_id, key):
+    lock = _build_locks.get((tournament_id, key))
+    if lock is None:
+        with _build_locks_guard:
+            lock = _build_locks.setdefault((tournament_id, key), threading.Lock())
+    return lock
+
+
+def cached_body(tournament_id, key, version, build):
+    """
+    (версия, JSON-строка таблицы). При промахе таблица строится через build() и
+    сохраняется как снимок версии version.
+
+    build() читает БД несколькими запросами, и между ними могут закоммитить новые
+    ответы. Поэтому после сборки версия перечитывается: снимок сохраняется, только
+    если она не сдвинулась (все чтения видели одно и то же состояние), иначе
+    таблица собирается заново для новой версии. Если версия так и не
+    устоялась за SNAPSHOT_BUILD_ATTEMPTS попыток, тело отдаётся без сохранения.
+    """
+    body = get_snapshot(tournament_id, key, version)
+    if body is not None:
+        return version, body
+
+    with _build_lock(tournament_id, key):
+        # пока ждали, таблицу этой версии мог собрать другой поток
+        body = get_snapshot(tournament_id, key, version)
+        if body is not None:
+            return version, body
+        for _ in range(SNAPSHOT_BUILD_ATTEMPTS):
+            body = current_app.json.dumps(build())
+            moved = current_score_version(tournament_id)
+            if moved == version:
+                put_snapshot(tournament_id, key, version, body)
+                return version, body
+            if moved is None:
+                break
+            version = moved
+            # кеш запроса (время блоков) прочитан до новой версии
+            invalidate()
+            cached = get_snapshot(tournament_id, key, version)
+            if cached is not None:
+                return version, cached
+    return version, body
+
+
+def delta_body(tournament_id, key, since, version, build, delta):
+    """
+    JSON-строка изменений таблицы key от версии since до version или None,
+    если снимка версии since уже нет (клиент слишком отстал) или delta() вернула None.
+    delta(old, new) получает обе таблицы как dict.
+
+    Дельта строится только между сохранёнными снимками ровно версий since и
+    version (cached_body сохраняет лишь согласованные таблицы). Если таблицу
+    пришлось собрать для другой версии, возвращается None — клиент получит
+    полную таблицу.
+    """
+    cached = _local_deltas.get((tournament_id, key, since))
+    if cached and cached[0] == version:
+        return cached[1]
+
+    old = get_snapshot(tournament_id, key, since)
+    if old is None:
+        return None
+    built, new = cached_body(tournament_id, key, version, build)
+    if built != version:
+        return None
+    changes = delta(current_app.json.loads(old), current_app.json.loads(new))
+    if changes is None:
+        return None
+    body = current_app.json.dumps(dict(changes, version=version, since=since))
+
+    for k in [k for k in _local_deltas if k[:2] == (tournament_id, key) and k[2] < since]:
+        # дельты от более старых версий после этой уже не спросят
+        del _local_deltas[k]
+    _local_deltas[(tournament_id, key, since)] = (version, body)
+    return body
+
+
+def _json_response(body, etag, version):
+    resp = current_app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    # браузер всегда переспрашивает сервер, но с If-None-Match — дешёвый 304
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Score-Version"] = str(version)
+    return resp
+
+
+def versioned_json(tournament_id, key, build, version=None, delta=None):
+    """
+    Ответ с таблицей результатов из кеша версии.
+    build() вызывается только если для текущей версии снимка ещё нет и должен
+    вернуть JSON-совместимый dict. Если у клиента та же версия — 304 без тела.
+
+    Если передан delta и в запросе есть ?since=<версия>, отдаются только изменения
+    с этой версии ({"version", "since", ...}); если клиент слишком отстал —
+    полная таблица. Текущая версия всегда в заголовке X-Score-Version.
+    """
+    if version is None:
+        version = current_score_version(tournament_id)
+    if version is None:
+        abort(404)
+
+    since = request.args.get("since", type=int) if delta is not None else None
+    if since is not None and since <= version:
+        etag = etag_for(tournament_id, f"{key}~{since}", version)
+    else:
+        since = None
+        etag = etag_for(tournament_id, key, version)
+
+    if etag in request.if_none_match:
+        resp = current_app.response_class(status=304)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Score-Version"] = str(version)
+        return resp
+
+    if since is not None:
+        body = delta_body(tournament_id, key, since, version, build, delta)
+        if body is not None:
+            return _json_response(body, etag, version)
+        etag = etag_for(tournament_id, key, version)
+
+    built, body = cached_body(tournament_id, key, version, build)
+    if built != version:
+        # результаты изменились, пока строили таблицу: отдаём более новую
+        version, etag = built, etag_for(tournament_id, key, built)
+    return _json_response(body, etag, version)
+
+
+def _forget_final(tournament_id):
+    tables = _final.pop(tournament_id, None) or {}
+    for key in tables:
+        if key.startswith("block:"):
+            _final_blocks.pop(int(key[len("block:"):]), None)
+    _final_checked.pop(tournament_id, None)
+
+
+def _on_scoreboard_event(payload):
+    # bump в другом воркере: итоговые таблицы этого турнира могли быть удалены
+    tournament_id = payload.get("k")
+    _final_resets[tournament_id] = _final_resets.get(tournament_id, 0) + 1
+    if tournament_id in _final:
+        _forget_final(tournament_id)
+
+
+def _freeze_final(tournament_id, tournament, build_all):
+    """
+    Строит итоговые таблицы и сохраняет их в final_results. Как и в cached_body,
+    версия результатов читается до и после сборки; сохраняются только таблицы,
+    все чтения которых видели одну версию. Перед вставкой строка турнира
+    блокируется (FOR SHARE): bump_score_version ждёт нашего commit и удаляет уже
+    вставленные итоги, а bump, успевший раньше, виден как сменившаяся версия.
+    Возвращает {key: json body} или None, если версия не устоялась за
+    SNAPSHOT_BUILD_ATTEMPTS попыток.
+    """
+    for _ in range(SNAPSHOT_BUILD_ATTEMPTS):
+        version = current_score_version(tournament_id)
+        tables = {key: current_app.json.dumps(data) for key, data in build_all(tournament).items()}
+        locked = db.session.query(Tournament.score_version).filter(
+            Tournament.id == tournament_id
+        ).with_for_update(read=True).scalar()
+        if locked is not None and locked == version:
+            db.session.execute(
+                pg_insert(FinalResult).values([
+                    {"tournament_id": tournament_id, "key": key, "payload": body}
+                    for key, body in tables.items()
+                ]).on_conflict_do_nothing()
+            )
+            db.session.commit()
+            return tables
+        # снимаем блокировку; кеш запроса (время блоков) прочитан до новой версии
+        db.session.commit()
+        invalidate()
+        if locked is None:
+            break
+    return None
+
+
+def final_tables(tournament_id, build_all):
+    """
+    Итоговые таблицы турнира {key: json body} или None, если турнир ещё не завершён.
+    Если турнир только что завершился — таблицы строятся через build_all(tournament)
+    (tournament — TournamentInfo, результат — {key: dict}) и сохраняются в final_results. Уже загруженные таблицы
+    отдаются из памяти воркера без запросов к БД.
+    """
+    tables = _final.get(tournament_id)
+    if tables is not None:
+        return tables
+
+    now = time.monotonic()
+    checked = _final_checked.get(tournament_id)
+    if checked is not None and now - checked < FINAL_CHECK_INTERVAL:
+        return None
+    _final_checked[tournament_id] = now
+    # удаление итогов в другом воркере должно сбрасывать и кеш этого
+    add_listener(SCOREBOARD_CHANNEL, _on_scoreboard_event)
+    resets = _final_resets.get(tournament_id)
+
+    tables = dict(
+        db.session.query(FinalResult.key, FinalResult.payload).filter_by(tournament_id=tournament_id).all()
+    )
+    if not tables:
+        tournament = tournament_structure(tournament_id)
+        if tournament is None:
+            _final_checked.pop(tournament_id, None)
+            return None
+        if not is_tournament_finished(tournament):
+            return None
+        tables = _freeze_final(tournament_id, tournament, build_all)
+        if tables is None:
+            # результаты всё ещё меняются (ответы в пределах отсрочки) — отдаём
+            # живые таблицы и пробуем заморозить при следующей проверке
+            return None
+
+    if _final_resets.get(tournament_id) != resets:
+        # пока читали, итоги сбросили (событие могло прийти раньше, чем мы их
+        # запомнили) — в память не кладём
+        _final_checked.pop(tournament_id, None)
+        return None
+    _final[tournament_id] = tables
+    for key in tables:
+        if key.startswith("block:"):
+            _final_blocks[int(key[len("block:"):])] = tournament_id
+    return tables
+
+
+def final_block_tournament(block_id):
+    """id турнира, если таблица блока уже заморожена в этом воркере."""
+    return _final_blocks.get(block_id)
+
+
+def final_json(tournament_id, key, body):
+    """
+    Ответ с итоговой таблицей. Итоги сбрасываются сбросом ответов и перепроверкой,
+    поэтому браузеры и прокси их не хранят, а переспрашивают (no-cache): ETag
+    считается по содержимому, неизменные итоги — дешёвый 304 из памяти воркера.
+    """
+    etag = f"final-{tournament_id}-{key}-{zlib.crc32(body.encode()):08x}"
+    if etag in request.if_none_match:
+        resp = current_app.response_class(status=304)
+    else:
+        resp = current_app.response_class(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
@@ -0,0 +1,26 @@
+// app/static/idempotent.js
+// POST команды с заголовком Idempotency-Key (см. app/idempotency.py): при обрыве
+// сети запрос повторяется с тем же ключом, и сервер отдаёт сохранённый ответ
+// вместо повторной записи ответов или повторного старта блока.
+
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+}
+
+async function postIdempotent(url, payload, retries = 2) {
+  const key = newIdempotencyKey();
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await fetch(url, {
+        method: "POST",
+        headers: {"Content-Type": "application/json", "X-Requested-With": "XMLHttpRequest", "Idempotency-Key": key},
+        credentials: "same-origin",
+        body: JSON.stringify(payload)
+      });
+    } catch (err) {
+      if (attempt >= retries) throw err;
+      await new Promise(resolve => setTimeout(resolve, 500 * (attempt + 1)));
+    }
+  }
+}
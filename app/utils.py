@@ -1,41 +1,417 @@
 # app/utils.py
 from datetime import datetime, timezone, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, and_, or_, case, literal_column, select, true
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .catalog import tournament_structure
+from .memo import cached
+
+
+class BlockTiming:
+    """Время блока для команды: start/end (datetime или None), state и time_left."""
+
+    __slots__ = ("block", "start", "end", "state", "time_left")
+
+    def __init__(self, block, start, end, now):
+        self.block = block
+        self.start = start
+        self.end = end
+        if start is None:
+            self.state = "pending"
+            self.time_left = None
+        elif end is not None:
+            self.state = "finished"
+            self.time_left = 0
+        else:
+            self.state = "running"
+            max_end = start + timedelta(seconds=block.max_duration)
+            self.time_left = max(0, (max_end - now).total_seconds())
+
+
+class TeamTimeline:
+    """
+    Время всех блоков турнира для команды — двумя запросами (блоки и записи
+    TeamBlockStart), независимо от числа блоков, задач и ответов.
+
+    Блок начинается, когда команда нажала "Начать следующий блок" на странице /waiting
+    (TeamBlockStart); первый блок — с начала турнира для команды (team.started_at).
+    Блок заканчивается, когда отвечены все задачи (время последнего ответа)
+    или когда вышла максимальная длительность блока. Время окончания записывается
+    в TeamBlockStart.finished_at один раз: при последнем нужном ответе
+    (record_completion) или при истечении времени (record_expired).
+    """
+
+    def __init__(self, team, blocks, starts, now=None):
+        # blocks — BlockInfo по порядку (см. app/catalog.py); starts: block_id -> TeamBlockStart
+        self.team = team
+        self.now = now or datetime.now(timezone.utc)
+        self.blocks = []
+        self._by_id = {}
+        self._rows = dict(starts)
+        self._first_order = blocks[0].order if blocks else None
+        for block in blocks:
+            self._set(block)
+
+    def _set(self, block):
+        row = self._rows.get(block.id)
+        start = row.started_at if row is not None else None
+        if start is None and block.order == self._first_order:
+            start = self.team.started_at
+        end = row.finished_at if row is not None else None
+        if start is not None and end is None:
+            max_end = start + timedelta(seconds=block.max_duration)
+            if self.now >= max_end:
+                end = max_end
+        timing = BlockTiming(block, start, end, self.now)
+        if block.id in self._by_id:
+            self.blocks[self.blocks.index(self._by_id[block.id])] = timing
+        else:
+            self.blocks.append(timing)
+        self._by_id[block.id] = timing
+        return timing
+
+    @classmethod
+    def load(cls, team, tournament_id, now=None):
+        """Timeline одной команды; в пределах запроса считается один раз (см. memo)."""
+        return cached(
+            "timeline", (team.id, int(tournament_id)),
+            lambda: cls.load_many([team], tournament_id, now)[team.id],
+        )
+
+    @classmethod
+    def load_many(cls, teams, tournament_id, now=None):
+        """{team_id: TeamTimeline} для нескольких команд одного турнира — те же два запроса."""
+        blocks = tournament_blocks(tournament_id)
+        starts = _block_starts([t.id for t in teams], [b.id for b in blocks])
+        now = now or datetime.now(timezone.utc)
+        return {t.id: cls(t, blocks, starts.get(t.id, {}), now) for t in teams}
+
+    def get(self, block):
+        """BlockTiming блока (TaskBlock или id) или None, если блок не из этого турнира."""
+        return self._by_id.get(getattr(block, "id", block))
+
+    def start_row(self, block):
+        """Запись TeamBlockStart блока или None (первый блок может идти и без неё)."""
+        return self._rows.get(getattr(block, "id", block))
+
+    @property
+    def active(self):
+        """Первый незаконченный блок (идёт или ещё не начат) или None, если все закончены."""
+        for timing in self.blocks:
+            if timing.state != "finished":
+                return timing
+        return None
+
+    @property
+    def state(self):
+        """"running", "waiting" или "finished" — как в /api/tournament/<id>."""
+        active = self.active
+        if active is not None:
+            return "running" if active.state == "running" else "waiting"
+        return "finished" if self.blocks else "waiting"
+
+    def _finish(self, timing, finished_at, reason):
+        row = finish_team_block(self.team.id, timing.block, timing.start, finished_at, reason)
+        self._rows[timing.block.id] = row
+        return self._set(timing.block)
+
+    def record_completion(self, block):
+        """
+        Записывает окончание идущего блока, если команда ответила на все его задачи.
+        Вызывать после flush новых ответов и до commit. Возвращает BlockTiming блока.
+        """
+        timing = self.get(block)
+        if timing is None or timing.state != "running":
+            return timing
+        n_answered, last_at = _answered_slots(self.team.id, timing.block.id)
+        if last_at is not None and n_answered >= timing.block.required_slots:
+            timing = self._finish(timing, last_at, "completed")
+        return timing
+
+    def record_expired(self):
+        """
+        Записывает окончание блоков, у которых вышло время, но finished_at ещё пуст.
+        Возвращает True, если что-то записано (нужен commit).
+        """
+        changed = False
+        for timing in list(self.blocks):
+            row = self._rows.get(timing.block.id)
+            if timing.state == "finished" and (row is None or row.finished_at is None):
+                self._finish(timing, timing.end, "timeout")
+                changed = True
+        return changed
+
+
+# Короткое состояние команды для частого опроса (/api/tournament/<id>/status),
+# посчитанное в этом воркере: team_id -> TeamStatus. Сбрасывается событиями
+# BLOCKS_CHANNEL о блоках команды и при окончании идущего блока по времени;
+# на случай пропущенного события живёт не дольше STATUS_MAX_AGE секунд.
+STATUS_MAX_AGE = 30
+
+_statuses = {}
+
+
+class TeamStatus:
+    """
+    state и активный блок команды; deadline — конец идущего блока по времени.
+    version — сколько блоков команды начато и закончено: меняется при каждом переходе.
+    """
+
+    __slots__ = ("tournament_id", "started_at", "state", "active_block_id", "deadline", "version", "valid_until")
+
+    def __init__(self, timeline, tournament_id, now):
+        self.tournament_id = tournament_id
+        self.started_at = timeline.team.started_at
+        self.state = timeline.state
+        active = timeline.active
+        self.active_block_id = active.block.id if active is not None else None
+        self.deadline = None
+        if active is not None and active.state == "running":
+            self.deadline = active.start + timedelta(seconds=active.block.max_duration)
+        self.version = sum((t.start is not None) + (t.end is not None) for t in timeline.blocks)
+        self.valid_until = now + timedelta(seconds=STATUS_MAX_AGE)
+        if self.deadline is not None:
+            self.valid_until = min(self.valid_until, self.deadline)
+
+    def as_dict(self, now):
+        return {
+            "tournament_id": self.tournament_id,
+            "state": self.state,
+            "active_block_id": self.active_block_id if self.state == "running" else None,
+            # следующий блок, который команда может начать
+            "next_block_id": self.active_block_id if self.state == "waiting" else None,
+            "time_left": max(0, (self.deadline - now).total_seconds()) if self.deadline else None,
+            "version": self.version,
+            "server_time": now.isoformat(),
+        }
+
+
+def team_status(team, tournament_id, now=None):
+    """
+    TeamStatus команды в турнире. Пока ничего не изменилось — из памяти воркера
+    без запросов; иначе пересчитывается по TeamTimeline (только чтение).
+    """
+    from .events import add_listener, BLOCKS_CHANNEL
+
+    now = now or datetime.now(timezone.utc)
+    status = _statuses.get(team.id)
+    if (
+        status is not None
+        and status.tournament_id == tournament_id
+        and status.started_at == team.started_at
+        and now < status.valid_until
+    ):
+        return status
+
+    # переходы в других воркерах приходят событиями
+    add_listener(BLOCKS_CHANNEL, _on_blocks_event)
+    status = TeamStatus(TeamTimeline.load(team, tournament_id, now), tournament_id, now)
+    _statuses[team.id] = status
+    return status
+
+
+def forget_team_status(team_id):
+    _statuses.pop(team_id, None)
+
+
+def _on_blocks_event(payload):
+    team_id = payload.get("team_id")
+    if team_id is not None:
+        forget_team_status(team_id)
+        return
+    # событие без команды (сброс из админки) — для всех команд турнира
+    for team_id, status in list(_statuses.items()):
+        if status.tournament_id == payload.get("k"):
+            forget_team_status(team_id)
+
+
+def finish_team_block(team_id, block, started_at, finished_at, reason):
+    """
+    Записывает окончание блока команды, если оно ещё не записано, одним upsert:
+    INSERT (первый блок идёт с team.started_at без записи) ... ON CONFLICT DO UPDATE
+    ... WHERE finished_at IS NULL — повторные и параллельные вызовы безопасны.
+    Только для первой записи отправляет событие BLOCKS_CHANNEL (после commit).
+    reason — "completed" (все ответы) или "timeout". Возвращает TeamBlockStart.
+    """
+    from .extensions import db
+    from .events import notify, BLOCKS_CHANNEL, TEAM_CHANNEL
+    from .models import TeamBlockStart
+
+    stmt = pg_insert(TeamBlockStart).values(
+        team_id=team_id, block_id=block.id, started_at=started_at, finished_at=finished_at
+    ).on_conflict_do_update(
+        constraint="uq_team_block_start",
+        set_={"finished_at": finished_at},
+        where=TeamBlockStart.finished_at.is_(None),
+    ).returning(TeamBlockStart)
+    # populate_existing — уже загруженная в сессию запись получает новое finished_at
+    row = db.session.scalars(stmt, execution_options={"populate_existing": True}).first()
+    if row is None:
+        # уже закончен раньше
+        return TeamBlockStart.query.filter_by(team_id=team_id, block_id=block.id).first()
+
+    notify(
+        BLOCKS_CHANNEL, block.tournament_id,
+        team_id=team_id, block_id=block.id, finished_at=finished_at.isoformat(), reason=reason,
+    )
+    notify(TEAM_CHANNEL, team_id, block_id=block.id, reason=reason)
+    forget_team_status(team_id)
+    return row
+
+
+def tournament_timings(tournament_id, now=None):
+    """
+    Текущий блок каждой команды турнира одним SQL-запросом — для мониторинга
+    (правила те же, что у TeamTimeline, без загрузки команд по одной).
+
+    Блоки нумеруются row_number(); время начала/окончания каждого блока команды
+    берётся из team_block_start (первый блок — с team.started_at, истёкший —
+    с started_at + max_duration); число законченных блоков — count() OVER.
+    Для каждой команды LATERAL выбирает первый незаконченный блок (или первый,
+    если закончены все), второй LATERAL считает закрытые ответами слоты этого блока.
+
+    Возвращает список dict по командам (по названию).
+    """
+    from .extensions import db
+    from .models import Answer, Task, TaskBlock, Team, TeamBlockStart
+
+    now = now or datetime.now(timezone.utc)
+    blocks = select(
+        TaskBlock.id, TaskBlock.name, TaskBlock.order, TaskBlock.max_duration, TaskBlock.required_slots,
+        func.row_number().over(order_by=(TaskBlock.order, TaskBlock.id)).label("n"),
+    ).where(TaskBlock.tournament_id == tournament_id).cte("b")
+
+    started = func.coalesce(TeamBlockStart.started_at, case((blocks.c.n == 1, Team.started_at)))
+    max_end = started + literal_column("interval '1 second'") * blocks.c.max_duration
+    finished = func.coalesce(TeamBlockStart.finished_at, case((max_end <= now, max_end)))
+    timing = select(
+        Team.id.label("team_id"),
+        blocks.c.id.label("block_id"),
+        blocks.c.name.label("block_name"),
+        blocks.c.order.label("block_order"),
+        blocks.c.n,
+        blocks.c.required_slots,
+        started.label("started_at"),
+        max_end.label("deadline"),
+        finished.label("finished_at"),
+        func.count(finished).over(partition_by=Team.id).label("blocks_finished"),
+    ).select_from(Team).join(blocks, true()).outerjoin(
+        TeamBlockStart,
+        and_(TeamBlockStart.team_id == Team.id, TeamBlockStart.block_id == blocks.c.id),
+    ).where(Team.tournament_id == tournament_id).cte("timing")
+
+    current = select(timing).where(
+        timing.c.team_id == Team.id
+    ).order_by(timing.c.finished_at.isnot(None), timing.c.n).limit(1).lateral("cur")
+
+    is_examples = Task.type == "examples"
+    is_single = or_(Task.type.is_(None), Task.type != "examples")
+    answered = select(
+        func.count(Answer.id).label("answered"),
+        func.max(Answer.submitted_at).label("last_answer_at"),
+    ).join(Task, Task.id == Answer.task_id).where(
+        Answer.team_id == Team.id,
+        Task.block_id == current.c.block_id,
+        or_(
+            and_(is_examples, Answer.example_id.isnot(None)),
+            and_(is_single, Answer.example_id.is_(None)),
+        ),
+    ).lateral("ans")
+
+    rows = db.session.execute(
+        select(
+            Team.id, Team.name, Team.started_at.label("team_started_at"),
+            current.c.block_id, current.c.block_name, current.c.block_order,
+            current.c.started_at, current.c.deadline, current.c.finished_at,
+            current.c.required_slots, current.c.blocks_finished,
+            answered.c.answered, answered.c.last_answer_at,
+        ).select_from(Team)
+        .outerjoin(current, true())
+        .outerjoin(answered, true())
+        .where(Team.tournament_id == tournament_id)
+        .order_by(Team.name, Team.id)
+    ).all()
+
+    out = []
+    for r in rows:
+        if r.block_id is None:
+            state = "waiting"  # в турнире нет блоков
+        elif r.finished_at is not None:
+            state = "finished"
+        elif r.started_at is not None:
+            state = "running"
+        else:
+            state = "waiting"
+        running = state == "running"
+        out.append({
+            "team_id": r.id,
+            "team_name": r.name,
+            "team_started_at": r.team_started_at.isoformat() if r.team_started_at else None,
+            "state": state,
+            "block_id": r.block_id if state != "finished" else None,
+            "block_name": r.block_name if state != "finished" else None,
+            "block_order": r.block_order if state != "finished" else None,
+            "started_at": r.started_at.isoformat() if running else None,
+            "deadline": r.deadline.isoformat() if running else None,
+            "time_left": max(0, (r.deadline - now).total_seconds()) if running else None,
+            "answered": int(r.answered or 0) if running else None,
+            "required": r.required_slots if running else None,
+            "last_answer_at": r.last_answer_at.isoformat() if running and r.last_answer_at else None,
+            "blocks_finished": int(r.blocks_finished or 0),
+        })
+    return out
+
+
+def tournament_blocks(tournament_id):
+    """Блоки турнира (BlockInfo) по порядку — из кеша структуры воркера (см. app/catalog.py)."""
+    tournament = tournament_structure(tournament_id)
+    return list(tournament.blocks) if tournament is not None else []
+
+
+def _answered_slots(team_id, block_id):
+    """
+    (сколько слотов блока закрыто ответами команды, время последнего ответа) — одним COUNT(*):
+    ответы на примеры для задач с примерами и ответы на задачу целиком для обычных.
+    """
+    from .extensions import db
+    from .models import Answer, Task
+
+    is_examples = Task.type == "examples"
+    is_single = or_(Task.type.is_(None), Task.type != "examples")
+    return db.session.query(
+        func.count(Answer.id), func.max(Answer.submitted_at)
+    ).join(Task, Task.id == Answer.task_id).filter(
+        Answer.team_id == team_id,
+        Task.block_id == block_id,
+        or_(
+            and_(is_examples, Answer.example_id.isnot(None)),
+            and_(is_single, Answer.example_id.is_(None)),
+        ),
+    ).one()
+
+
+def _block_starts(team_ids, block_ids):
+    """team_id -> {block_id -> TeamBlockStart}."""
+    from .models import TeamBlockStart
+
+    starts = {}
+    if not team_ids or not block_ids:
+        return starts
+    rows = TeamBlockStart.query.filter(
+        TeamBlockStart.team_id.in_(team_ids), TeamBlockStart.block_id.in_(block_ids)
+    )
+    for s in rows:
+        starts.setdefault(s.team_id, {})[s.block_id] = s
+    return starts
+
 
 def get_team_block_start_time(team, block):
     """
     Определяет время начала блока для команды.
     Блок начинается когда команда нажала кнопку "Начать следующий блок" на станице /waiting.
-    Для первого блока - автоматиечски начинается при первом ответе (для обратной совместимости).    
+    Для первого блока - автоматиечски начинается при первом ответе (для обратной совместимости).
     Возвращает datetime или None если блок еще не начался.
     """
-    from .models import Answer, TaskBlock, TeamBlockStart
-    
-    # Время начала турнира для команды
-    block_start = TeamBlockStart.query.filter_by(
-        team_id=team.id,
-        block_id=block.id
-    ).first()
-    
-    if block_start:
-        return block_start.started_at
-    
-    # Для обратной совместимости: если это первый блок и команда ещё не начинала блоки явно,
-    # то первый блок начинается при первом ответе или с начала турнира
-    prev_block = TaskBlock.query.filter_by(
-        tournament_id=block.tournament_id
-    ).filter(
-        TaskBlock.order < block.order
-    ).order_by(TaskBlock.order.desc()).first()
-    
-    if not prev_block:
-        # Это первый блок - начинается с начала турнира
-        team_start = team.started_at
-        if team_start:
-            return team_start
-    
-    # Если время не установлено - блок ещё не начался
-    return None
+    return TeamTimeline.load(team, block.tournament_id).get(block).start
 
 def get_team_block_end_time(team, block):
     """
@@ -43,110 +419,36 @@ def get_team_block_end_time(team, block):
     Блок заканчивается когда:
     1. Все задачи в блоке решены, ИЛИ
     2. Достигнута максимальная длительность блока
-    
+
     Возвращает datetime или None если блок еще не закончен.
     """
-    from .models import Answer, Task
-    
-    block_start = get_team_block_start_time(team, block)
-    if not block_start:
-        return None
-    
-    # Проверим, отвечены ли все задачи (независимо от правильности)
-    all_tasks = Task.query.filter_by(block_id=block.id).all()
-    all_answered = True
-    
-    for task in all_tasks:
-        if task.type == "examples":
-            # Для задач с примерами нужно проверить все примеры
-            examples = task.examples
-            for example in examples:
-                answer = Answer.query.filter_by(
-                    team_id=team.id,
-                    task_id=task.id,
-                    example_id=example.id
-                ).first()
-                if not answer:
-                    all_answered = False
-                    break
-            if not all_answered:
-                break
-        else:
-            # Для обычных задач нужен любой ответ
-            answer = Answer.query.filter_by(
-                team_id=team.id,
-                task_id=task.id,
-                example_id=None
-            ).first()
-            if not answer:
-                all_answered = False
-                break
-    
-    if all_answered:
-        # Найти время последнего ответа в блоке
-        last_answer = Answer.query.filter_by(team_id=team.id).join(
-            Answer.task
-        ).filter(
-            Answer.task.has(block_id=block.id)
-        ).order_by(Answer.submitted_at.desc()).first()
-        
-        if last_answer:
-            return last_answer.submitted_at
-    
-    # Проверим максимальную длительность
-    max_end = block_start + timedelta(seconds=block.max_duration)
-    now = datetime.now(timezone.utc)
-    
-    if now >= max_end:
-        return max_end
-    
-    return None
+    return TeamTimeline.load(team, block.tournament_id).get(block).end
 
 def get_team_active_block(team, tournament):
     """
     Определяет активный блок для команды.
     Возвращает TaskBlock или None.
     """
-    from .models import TaskBlock
-    
-    blocks = TaskBlock.query.filter_by(
-        tournament_id=tournament.id
-    ).order_by(TaskBlock.order.asc()).all()
-    
-    if not blocks:
-        return None
-    
-    now = datetime.now(timezone.utc)
-    
-    for block in blocks:
-        block_start = get_team_block_start_time(team, block)
-        block_end = get_team_block_end_time(team, block)
-        
-        if block_start and not block_end:
-            # Блок начался и еще не закончен
-            return block
-        elif not block_start:
-            # Блок еще не начался - это следующий активный блок
-            return block
-    
-    # Все блоки закончены
-    return None
+    active = TeamTimeline.load(team, tournament.id).active
+    return active.block if active else None
 
 def get_team_block_time_left(team, block):
     """
     Возвращает оставшееся время блока для команды в секундах.
     Учитывает максимальную длительность и время начала блока.
     """
-    block_start = get_team_block_start_time(team, block)
-    if not block_start:
-        return None
-    
-    block_end = get_team_block_end_time(team, block)
-    if block_end:
-        return 0  # Блок уже закончен
-    
-    now = datetime.now(timezone.utc)
-    max_end = block_start + timedelta(seconds=block.max_duration)
-    
-    time_left = (max_end - now).total_seconds()
-    return max(0, time_left)
+    return TeamTimeline.load(team, block.tournament_id).get(block).time_left
+
+def is_tournament_finished(tournament, now=None):
+    """
+    Турнир завершён, когда каждая команда турнира начала и закончила каждый блок
+    (то же правило, что и состояние "finished" в api.get_tournament).
+    Проверяет все команды сразу, тремя запросами.
+    """
+    from .models import Team
+
+    teams = Team.query.filter_by(tournament_id=tournament.id).all()
+    if not teams:
+        return False
+    timelines = TeamTimeline.load_many(teams, tournament.id, now)
+    return all(timeline.state == "finished" for timeline in timelines.values())
@@ -1,6 +1,11 @@
-from flask import Blueprint, request, abort, redirect, url_for, render_template
+from flask import Blueprint, request, abort, redirect, url_for, render_template, jsonify
 from app.extensions import db
-from app.models import Answer, Task, Team, Tournament, TeamBlockStart
+from app.models import Answer, Task, TaskBlock, Team, Tournament, TeamBlockStart, TeamScore, IdempotencyKey
+from app.snapshots import bump_score_version, bump_all_score_versions
+from app.catalog import bump_content_version, tournament_structure
+from app.events import notify, BLOCKS_CHANNEL, TEAM_CHANNEL
+from app.utils import tournament_timings
+from app.regrade import regrade_answers
 from datetime import datetime, timezone
 from os import getenv
 
@@ -17,14 +22,24 @@ def check():
 @bp.route("/__admin/reset_answers")
 def reset_answers():
     check()
+    TeamScore.query.delete()
     Answer.query.delete()
+    # сохранённые ответы на повторы запросов больше не соответствуют данным
+    IdempotencyKey.query.delete()
+    # блоки, законченные ответами, снова идут (истёкшие по времени запишутся заново)
+    TeamBlockStart.query.update({TeamBlockStart.finished_at: None}, synchronize_session=False)
+    for (tournament_id,) in db.session.query(Tournament.id):
+        notify(BLOCKS_CHANNEL, tournament_id, reason="reset")
+    bump_all_score_versions()
     db.session.commit()
     return "answers cleared"
 
 @bp.route("/__admin/reset_teams")
 def reset_teams():
     check()
+    TeamScore.query.delete()
     Team.query.delete()
+    bump_all_score_versions()
     db.session.commit()
     return "teams cleared"
 
@@ -40,12 +55,17 @@ def reset_team():
     if not team:
         abort(404, f"Team '{team_name}' not found")
     
-    # Delete all answers for this team
+    # Delete all answers (and their score aggregates) for this team
+    TeamScore.query.filter_by(team_id=team.id).delete()
     Answer.query.filter_by(team_id=team.id).delete()
     
     # Delete all block starts for this team
     TeamBlockStart.query.filter_by(team_id=team.id).delete()
-    
+    IdempotencyKey.query.filter_by(team_id=team.id).delete()
+    notify(BLOCKS_CHANNEL, team.tournament_id, team_id=team.id, reason="reset")
+    notify(TEAM_CHANNEL, team.id, reason="reset")
+
+    bump_score_version(team.tournament_id, [team.id])
     db.session.commit()
     return f"Team '{team_name}' has been reset (answers and block starts removed)"
 
@@ -98,6 +118,7 @@ def add_team():
     )
     team.set_password(password)
     db.session.add(team)
+    bump_score_version(tournament_id)
     db.session.commit()
 
     return f"team '{team_name}' added with password to tournament {tournament_id}"
@@ -106,11 +127,19 @@ def add_team():
 def add_task():
     check()
 
-    order = int(request.args.get("order"))
+    order = request.args.get("order", type=int)
     if not order:
         abort(400, "order required")
 
-    if Task.query.filter_by(order=order).first():
+    # задача всегда принадлежит блоку; order уникален в пределах блока
+    block_id = request.args.get("block_id", type=int)
+    if not block_id:
+        abort(400, "block_id required: tasks are added to a block, and order is unique within that block")
+    block = db.session.get(TaskBlock, block_id)
+    if not block:
+        abort(400, f"block with id {block_id} not found")
+
+    if Task.query.filter_by(block_id=block.id, order=order).first():
         return f"task №'{order}' already exists"
 
     text = request.args.get("text")
@@ -121,12 +150,80 @@ def add_task():
         abort(400, "answer required")
     
     image_url = request.args.get("image_url")
-    task = Task(order=order, correct_answer=answer, text=text, image_url=image_url)
+    task = Task(order=order, correct_answer=answer, text=text, image_url=image_url, block=block)
     db.session.add(task)
+    # структура турнира изменилась — сбросить её кеш и таблицы во всех воркерах
+    bump_content_version(block.tournament_id)
+    bump_score_version(block.tournament_id)
     db.session.commit()
 
     return f"task №'{order}' added"
 
+@bp.route("/__admin/regrade")
+def regrade():
+    """
+    Перепроверка сохранённых ответов по текущим ключам после исправления
+    correct_answer: task_id, block_id или tournament_id (JSON со статистикой).
+    """
+    check()
+    task_id = request.args.get("task_id", type=int)
+    block_id = request.args.get("block_id", type=int)
+    tournament_id = request.args.get("tournament_id", type=int)
+
+    task_ids = None
+    if task_id:
+        tournament_id = db.session.query(TaskBlock.tournament_id).join(
+            Task, Task.block_id == TaskBlock.id
+        ).filter(Task.id == task_id).scalar()
+        if tournament_id is None:
+            abort(404, f"task with id {task_id} not found")
+        task_ids = [task_id]
+    elif block_id:
+        tournament_id = db.session.query(TaskBlock.tournament_id).filter(TaskBlock.id == block_id).scalar()
+        if tournament_id is None:
+            abort(404, f"block with id {block_id} not found")
+        task_ids = [tid for (tid,) in db.session.query(Task.id).filter(Task.block_id == block_id)]
+    elif not tournament_id:
+        abort(400, "task_id, block_id or tournament_id required")
+
+    stats = regrade_answers(tournament_id, task_ids)
+    if stats is None:
+        abort(404, f"tournament with id {tournament_id} not found")
+    db.session.commit()
+    return jsonify(dict(stats, tournament_id=tournament_id))
+
+@bp.route("/__admin/monitor/<int:tournament_id>")
+def monitor(tournament_id):
+    """
+    Мониторинг турнира: текущий блок, оставшееся время и число ответов
+    каждой команды (JSON). Все команды — одним запросом (utils.tournament_timings).
+    """
+    check()
+    tournament = tournament_structure(tournament_id)
+    if tournament is None:
+        abort(404, f"tournament with id {tournament_id} not found")
+
+    now = datetime.now(timezone.utc)
+    teams = tournament_timings(tournament_id, now)
+
+    states = {"waiting": 0, "running": 0, "finished": 0}
+    running = {b.id: 0 for b in tournament.blocks}
+    for t in teams:
+        states[t["state"]] += 1
+        if t["state"] == "running":
+            running[t["block_id"]] += 1
+
+    return jsonify({
+        "tournament": {"id": tournament.id, "name": tournament.name},
+        "server_time": now.isoformat(),
+        "states": states,
+        "blocks": [
+            {"id": b.id, "name": b.name, "order": b.order, "running": running[b.id]}
+            for b in tournament.blocks
+        ],
+        "teams": teams,
+    })
+
 @bp.route("/__admin/teams", methods=["GET", "POST"])
 def manage_teams():
     """
@@ -169,6 +266,7 @@ def manage_teams():
                     )
                     team.set_password(password)
                     db.session.add(team)
+                    bump_score_version(tournament_id)
                     db.session.commit()
                     
                     message = f"Команда '{team_name}' успешно добавлена"
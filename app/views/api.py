@@ -1,15 +1,38 @@
 # app/views/api.py
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, jsonify, request, current_app, stream_with_context, abort
 from flask_login import login_required, current_user
 from ..models import Team, Answer, Tournament, TaskBlock, Task, TaskExample, db, TeamBlockStart
 from datetime import datetime, timezone, timedelta
 from collections import defaultdict
-from ..utils import (
-    get_team_active_block,
-    get_team_block_time_left,
-    get_team_block_end_time,
-    get_team_block_start_time,
+import json
+import threading
+import time
+from ..utils import TeamTimeline, team_status
+from ..scoreboard import (
+    refresh_team_scores,
+    upsert_answers,
+    overall_rows,
+    block_table,
+    full_payload,
+    block_json,
+    tournament_ranking,
+    diff_rows,
 )
+from ..ranking import rank_rows
+from ..snapshots import (
+    bump_score_version,
+    versioned_json,
+    cached_body,
+    current_score_version,
+    final_tables,
+    final_block_tournament,
+    final_json,
+)
+from ..events import subscribe, SCOREBOARD_CHANNEL, TEAM_CHANNEL
+from ..memo import invalidate
+from ..catalog import tournament_structure, block_structure, task_structure
+from ..grading import grade
+from ..idempotency import commit_response, idempotent
 from sqlalchemy.orm import joinedload
 
 bp = Blueprint("api", __name__, url_prefix="/api")
@@ -32,7 +55,7 @@ def get_tournament(tid):
     if not tid:
         return jsonify({"error": "tournament id required (use ?id=NN)"}), 400
 
-    tournament = Tournament.query.get(tid)
+    tournament = tournament_structure(tid)
     if not tournament:
         return jsonify({"error": "No tournament found with id {}".format(tid)}), 404
 
@@ -44,46 +67,28 @@ def get_tournament(tid):
         team.started_at = now
         db.session.commit()
 
-    # Определяем активный блок для команды
-    active_block = get_team_active_block(team, tournament)
+    # Время всех блоков команды — одним набором запросов
+    timeline = TeamTimeline.load(team, tournament.id, now)
+    if timeline.record_expired():
+        db.session.commit()
+    active = timeline.active
     active_block_obj = None
-    state = "waiting"
-    
-    if active_block:
-        block_start = get_team_block_start_time(team, active_block)
-        block_end = get_team_block_end_time(team, active_block)
-        if block_start and not block_end:
-            time_left = get_team_block_time_left(team, active_block)
-            active_block_obj = {
-                "id": active_block.id,
-                "name": active_block.name,
-                "order": active_block.order,
-                "max_duration": active_block.max_duration,
-                "image_url": active_block.image_url,
-                "time_left": time_left,
-            }
-            state = "running"
-        else:
-            # блок еще не начат (pending)
-            state = "waiting"
-
-    blocks_sorted = sorted(list(tournament.blocks), key=lambda b: b.order)
-    block_timings = []
-    for block in blocks_sorted:
-        start_ts = get_team_block_start_time(team, block)
-        end_ts = get_team_block_end_time(team, block)
-        block_timings.append((block, start_ts, end_ts))
-
-    if not active_block:
-        any_started = any(start_ts is not None for (_, start_ts, _) in block_timings)
-        all_finished = all((start_ts is not None and end_ts is not None) for (_, start_ts, end_ts) in block_timings)
-        if any_started and all_finished:
-            state = "finished"
-        else:
-            state = "waiting"
+    state = timeline.state
+
+    if active is not None and active.state == "running":
+        active_block = active.block
+        active_block_obj = {
+            "id": active_block.id,
+            "name": active_block.name,
+            "order": active_block.order,
+            "max_duration": active_block.max_duration,
+            "image_url": active_block.image_url,
+            "time_left": active.time_left,
+        }
 
     blocks_payload = []
-    for block, block_start, block_end in block_timings:
+    for timing in timeline.blocks:
+        block, block_start, block_end = timing.block, timing.start, timing.end
         start_offset = None
         if block_start and team.started_at:
             start_offset = int((block_start - team.started_at).total_seconds())
@@ -100,7 +105,7 @@ def get_tournament(tid):
     response = {
         "id": tournament.id,
         "name": tournament.name,
-        "group": getattr(tournament, "group", None),
+        "group": tournament.group,
         "server_time": now.isoformat(),
         "started_at": team.started_at.isoformat() if team.started_at else None,
         "state": state,
@@ -110,10 +115,55 @@ def get_tournament(tid):
     return jsonify(response)
 
 
+@bp.route("/tournament/<int:tid>/status", methods=["GET"])
+@login_required
+def get_tournament_status(tid):
+    """
+    Короткое состояние команды для опроса со страниц турнира и ожидания:
+    state, id активного блока, time_left и version (меняется при каждом начале
+    и окончании блока). Пока ничего не изменилось — из памяти воркера, без
+    запросов к БД. Полный /api/tournament/<id> нужен только при загрузке страницы.
+    """
+    if current_user.tournament_id != tid:
+        return jsonify({"error": "Team is not registered for this tournament"}), 404
+
+    now = datetime.now(timezone.utc)
+    resp = jsonify(team_status(current_user, tid, now).as_dict(now))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+@bp.route("/tournament/<int:tid>/place", methods=["GET"])
+@login_required
+def get_my_place(tid):
+    """Место текущей команды в общей таблице турнира (с диапазоном при ничьей)."""
+    if current_user.tournament_id != tid:
+        return jsonify({"error": "Team is not registered for this tournament"}), 404
+
+    version = current_score_version(tid)
+    if version is None:
+        return jsonify({"error": "No tournament found with id {}".format(tid)}), 404
+
+    ranking = tournament_ranking(tid, version)
+    if current_user.id not in ranking:
+        return jsonify({"error": "Team not found"}), 404
+
+    place_from, place_to = ranking.tie_range(current_user.id)
+    return jsonify({
+        "team_id": current_user.id,
+        "total": ranking.total(current_user.id),
+        "place": ranking.label(current_user.id),
+        "place_from": place_from,
+        "place_to": place_to,
+        "teams": len(ranking),
+        "version": version,
+    })
+
+
 @bp.route("/block/<int:block_id>", methods=["GET"])
 @login_required
 def get_block(block_id):
-    block = TaskBlock.query.get(block_id)
+    block = block_structure(block_id)
     if not block:
         return jsonify({"error": "Block not found"}), 404
 
@@ -125,66 +175,40 @@ def get_block(block_id):
         team.started_at = now
         db.session.commit()
     
-    from ..utils import get_team_block_start_time, get_team_block_end_time
-    block_start = get_team_block_start_time(team, block)
-    block_end = get_team_block_end_time(team, block)
-    
-    is_active = block_start is not None and block_end is None
-    is_finished = block_end is not None
-    
-    time_left = get_team_block_time_left(team, block)
+    timeline = TeamTimeline.load(team, block.tournament_id, now)
+    if timeline.record_expired():
+        db.session.commit()
+    timing = timeline.get(block)
+
+    is_active = timing.state == "running"
+    is_finished = timing.state == "finished"
+
+    time_left = timing.time_left
 
     tasks_data = []
     # Задачи доступны если блок активен или закончен
     if is_active or is_finished:
+        # ответы команды на все задачи блока (включая ответы по примерам) — одним запросом
+        answers_by_task = defaultdict(list)
+        for task_id, example_id, is_correct in db.session.query(
+            Answer.task_id, Answer.example_id, Answer.is_correct
+        ).filter(
+            Answer.team_id == current_user.id,
+            Answer.task_id.in_([task.id for task in block.tasks]),
+        ):
+            answers_by_task[task_id].append((example_id, is_correct))
+
         for task in block.tasks:
             # points: если в БД None — вернуть 0 (или любое другое безопасное значение)
             pts = task.points if (task.points is not None) else 0
 
-            # статус для текущей команды (best-effort; если неавторизован — none)
-            status = "none"
-            try:
-                if getattr(current_user, "is_authenticated", False):
-                    # берем все ответы этой команды по задаче (включая ответы по примерам)
-                    if task.type == "examples":
-                        # Для задач с примерами проверяем все примеры
-                        examples = task.examples
-                        answers = Answer.query.filter_by(team_id=current_user.id, task_id=task.id).all()
-                        if not answers or len(answers) == 0:
-                            status = "none"
-                        else:
-                            # Проверяем все ли примеры отвечены
-                            answered_examples = set(a.example_id for a in answers if a.example_id is not None)
-                            total_examples = len(examples)
-                            if len(answered_examples) < total_examples:
-                                status = "none"
-                            else:
-                                # Считаем правильные ответы
-                                correct_count = sum(1 for a in answers if a.is_correct)
-                                if correct_count == total_examples:
-                                    status = "right"
-                                elif correct_count > 0:
-                                    status = "partial"
-                                else:
-                                    status = "wrong"
-                    else:
-                        # Для обычных задач
-                        answers = Answer.query.filter_by(team_id=current_user.id, task_id=task.id, example_id=None).all()
-                        if not answers:
-                            status = "none"
-                        else:
-                            answer = answers[0]
-                            status = "right" if answer.is_correct else "wrong"
-            except Exception:
-                status = "none"
-
             tasks_data.append({
                 "id": task.id,
                 "title": task.title,
                 "points": pts,
                 "order": task.order,
                 "type": getattr(task, "type", "single"),
-                "status": status
+                "status": _task_status(task, answers_by_task.get(task.id, ()))
             })
 
     response = {
@@ -202,17 +226,54 @@ def get_block(block_id):
 
 
 
+def _task_status(task, answers):
+    """
+    Статус задачи для команды: "none", "right", "wrong" или "partial" (для задачи
+    с примерами). answers — [(example_id, is_correct)] ответов команды на задачу.
+    """
+    if task.type == "examples":
+        # Для задач с примерами: все ли примеры отвечены и сколько верно
+        answered_examples = set(example_id for example_id, _ in answers if example_id is not None)
+        total_examples = len(task.examples)
+        if not answers or len(answered_examples) < total_examples:
+            return "none"
+        correct_count = sum(1 for _, is_correct in answers if is_correct)
+        if correct_count == total_examples:
+            return "right"
+        if correct_count > 0:
+            return "partial"
+        return "wrong"
+
+    # Для обычных задач — ответ на задачу целиком
+    for example_id, is_correct in answers:
+        if example_id is None:
+            return "right" if is_correct else "wrong"
+    return "none"
+
+
+def _answer_json(answer):
+    return {
+        "answer_text": answer.answer_text,
+        "is_correct": answer.is_correct,
+        "points": getattr(answer, "points", None),
+        "submitted_at": answer.submitted_at.isoformat() if answer.submitted_at else None
+    }
+
+
 @bp.route("/task/<int:task_id>", methods=["GET"])
 @login_required
 def api_get_task(task_id):
-    task = Task.query.get_or_404(task_id)
-
-    # существующий ответ на обычную задачу (example_id IS NULL)
-    existing = Answer.query.filter_by(
-        team_id=current_user.id,
-        task_id=task.id,
-        example_id=None
-    ).first()
+    task = task_structure(task_id)
+    if task is None:
+        abort(404)
+
+    # ответы команды на задачу и на все её примеры — одним запросом;
+    # example_id None — ответ на обычную задачу
+    answers = {
+        answer.example_id: answer
+        for answer in Answer.query.filter_by(team_id=current_user.id, task_id=task.id)
+    }
+    existing = answers.get(None)
 
     data = {
         "id": task.id,
@@ -222,114 +283,49 @@ def api_get_task(task_id):
         "image_url": task.image_url,
         "points": task.points,
         "order": task.order,
-        "existing_answer": None,
+        "existing_answer": _answer_json(existing) if existing else None,
         "examples": []
     }
 
-    if existing:
-        data["existing_answer"] = {
-            "answer_text": existing.answer_text,
-            "is_correct": existing.is_correct,
-            "points": getattr(existing, "points", None),
-            "submitted_at": existing.submitted_at.isoformat() if existing.submitted_at else None
-        }
-
     # для задач типа "examples" отдаём массив примеров и (если есть) saved answer для каждого
-    examples = TaskExample.query.filter_by(task_id=task.id).order_by(TaskExample.id).all()
-    for ex in examples:
-        ea = Answer.query.filter_by(
-            team_id=current_user.id,
-            task_id=task.id,
-            example_id=ex.id
-        ).first()
+    for ex in task.examples:
+        ea = answers.get(ex.id)
         data["examples"].append({
             "id": ex.id,
             "text": ex.text,
             "points": getattr(ex, "points", None),
-            "existing_answer": {
-                "answer_text": ea.answer_text,
-                "is_correct": ea.is_correct,
-                "points": getattr(ea, "points", None),
-                "submitted_at": ea.submitted_at.isoformat() if ea.submitted_at else None
-            } if ea else None
+            "existing_answer": _answer_json(ea) if ea else None
         })
 
     return jsonify(data)
 
 
 
-@bp.route("/task/<int:task_id>", methods=["POST"])
-@login_required
-def api_post_task(task_id):
-    task = Task.query.get_or_404(task_id)
-
-    data = None
-    if request.is_json:
-        data = request.get_json()
-    else:
-        if "answer" in request.form:
-            data = {"answer": request.form["answer"]}
-
-    if not data:
-        return jsonify({"ok": False, "error": "Answer required"}), 400
-
+def _grade_task_answers(task, data):
+    """
+    Проверяет ответы на задачу task (TaskInfo) из тела запроса: {"answer": ...}
+    для обычной задачи или {"answers": [{"example_id", "answer"}]} для задачи с примерами.
+    Возвращает (rows для upsert_answers, поля ответа клиенту); ValueError — неверный формат.
+    """
     # --- обычная задача ---
     if "answer" in data:
-        existing = Answer.query.filter_by(
-            team_id=current_user.id,
-            task_id=task.id,
-            example_id=None
-        ).first()
-
         ans_text = str(data["answer"])
-        is_correct = (ans_text.strip() == (task.correct_answer or "").strip())
-
-        if existing:
-            existing.answer_text = ans_text
-            existing.is_correct = is_correct
-            existing.points = (task.points if is_correct else 0)
-            answer = existing
-        else:
-            answer = Answer(
-                team_id=current_user.id,
-                task_id=task.id,
-                example_id=None,
-                answer_text=ans_text,
-                is_correct=is_correct,
-                points=(task.points if is_correct else 0)
-            )
-            db.session.add(answer)
-        db.session.commit()
-        
-        # Проверяем, завершен ли блок после сохранения ответа
-        response_data = {"ok": True, "is_correct": is_correct, "answer_text": ans_text}
-        block = task.block
-        if block:
-            block_end_time = get_team_block_end_time(current_user, block)
-            if block_end_time is not None:
-                # Блок завершен, проверяем следующий блок
-                response_data["block_completed"] = True
-                tournament = Tournament.query.get(block.tournament_id)
-                next_block = get_team_active_block(current_user, tournament)
-                if next_block and next_block.id != block.id:
-                    # Есть следующий блок
-                    response_data["next_block"] = {
-                        "id": next_block.id,
-                        "name": next_block.name,
-                        "order": next_block.order
-                    }
-                # Если next_block нет или он равен текущему - это последний блок, next_block не добавляем
-        
-        return jsonify(response_data)
+        is_correct, awarded = grade(task, ans_text)
+        rows = [(task.id, None, ans_text, is_correct, awarded)]
+        return rows, {"is_correct": is_correct, "answer_text": ans_text}
 
     # --- задача с примерами ---
-    elif "answers" in data:
+    if "answers" in data:
         answers = data["answers"]
         if not isinstance(answers, list):
-            return jsonify({"ok": False, "error": "Answers must be a list"}), 400
+            raise ValueError("Answers must be a list")
 
         results = []
+        rows = []
         for ans in answers:
+            if not isinstance(ans, dict):
+                results.append({"example_id": None, "error": "example_id required"})
+                continue
             ex_id = ans.get("example_id")
             ans_text = str(ans.get("answer", ""))
 
@@ -338,66 +334,168 @@ def api_post_task(task_id):
                 continue
 
             # защитная проверка — существует ли пример
-            example = TaskExample.query.get(ex_id)
-            if not example or example.task_id != task.id:
+            # пример из структуры турнира — без запроса на каждый ответ
+            example = task.example(ex_id)
+            if not example:
                 results.append({"example_id": ex_id, "error": "Example not found"})
                 continue
 
-            # уже отправляли ли ответ на этот пример?
-            existing = Answer.query.filter_by(
-                team_id=current_user.id,
-                task_id=task.id,
-                example_id=ex_id
-            ).first()
-
-            is_correct = (ans_text.strip() == (example.correct_answer or "").strip())
-            points = getattr(example, "points", None)
-            if points is None:
-                points = 0
-            awarded = points if is_correct else 0
-
-            if existing:
-                existing.answer_text = ans_text
-                existing.is_correct = is_correct
-                existing.points = awarded
-            else:
-                answer_obj = Answer(
-                    team_id=current_user.id,
-                    task_id=task.id,
-                    example_id=ex_id,
-                    answer_text=ans_text,
-                    is_correct=is_correct,
-                    points=awarded
-                )
-                db.session.add(answer_obj)
+            # ключ разобран заранее (app/grading.py) — без запроса к БД
+            is_correct, awarded = grade(task, ans_text, example)
 
+            rows.append((task.id, example.id, ans_text, is_correct, awarded))
             results.append({"example_id": ex_id, "is_correct": is_correct, "points": awarded})
+        return rows, {"results": results}
+
+    raise ValueError("Invalid payload")
+
+
+def _block_completion(timeline, block):
+    """Поля ответа о завершении блока после записи ответов: block_completed и next_block."""
+    response_data = {}
+    if timeline.get(block).end is not None:
+        # Блок завершен, проверяем следующий блок
+        response_data["block_completed"] = True
+        next_block = timeline.active.block if timeline.active else None
+        if next_block and next_block.id != block.id:
+            # Есть следующий блок
+            response_data["next_block"] = {
+                "id": next_block.id,
+                "name": next_block.name,
+                "order": next_block.order
+            }
+        # Если next_block нет или он равен текущему - это последний блок, next_block не добавляем
+    return response_data
+
+
+def _save_answers(block, tasks, rows, missing_rows=(), timeline=None):
+    """
+    Записывает ответы команды на задачи блока и один раз проверяет, не закончен
+    ли этим блок. timeline — уже загруженный TeamTimeline команды, если есть.
+    Возвращает TeamTimeline после записи; commit — за вызывающим
+    (commit_response, вместе с ответом на запрос).
+    """
+    upsert_answers(current_user.id, rows)
+    upsert_answers(current_user.id, missing_rows, only_missing=True)
+    refresh_team_scores(current_user.id, tasks)
+    # если это были последние нужные ответы — фиксируем окончание блока
+    if timeline is None:
+        timeline = TeamTimeline.load(current_user, block.tournament_id)
+    timeline.record_completion(block)
+    bump_score_version(block.tournament_id, [current_user.id])
+    return timeline
 
-        db.session.commit()
-        
-        # Проверяем, завершен ли блок после сохранения ответов
-        response_data = {"ok": True, "results": results}
-        block = task.block
-        if block:
-            block_end_time = get_team_block_end_time(current_user, block)
-            if block_end_time is not None:
-                # Блок завершен, проверяем следующий блок
-                response_data["block_completed"] = True
-                tournament = Tournament.query.get(block.tournament_id)
-                next_block = get_team_active_block(current_user, tournament)
-                if next_block and next_block.id != block.id:
-                    # Есть следующий блок
-                    response_data["next_block"] = {
-                        "id": next_block.id,
-                        "name": next_block.name,
-                        "order": next_block.order
-                    }
-                # Если next_block нет или он равен текущему - это последний блок, next_block не добавляем
-        
-        return jsonify(response_data)
 
+@bp.route("/task/<int:task_id>", methods=["POST"])
+@login_required
+@idempotent
+def api_post_task(task_id):
+    task = task_structure(task_id)
+    if task is None:
+        abort(404)
+
+    data = None
+    if request.is_json:
+        data = request.get_json()
     else:
-        return jsonify({"ok": False, "error": "Invalid payload"}), 400
+        if "answer" in request.form:
+            data = {"answer": request.form["answer"]}
+
+    if not data:
+        return jsonify({"ok": False, "error": "Answer required"}), 400
+
+    try:
+        rows, result = _grade_task_answers(task, data)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+
+    # новый ответ или перезапись прежнего — одним upsert, сколько бы примеров ни было
+    timeline = _save_answers(task.block, [task], rows)
+
+    # Проверяем, завершен ли блок после сохранения ответа
+    response_data = {"ok": True, **result}
+    response_data.update(_block_completion(timeline, task.block))
+    return commit_response(jsonify(response_data))
+
+
+# автоотправка по таймеру приходит уже после конца блока (сеть, очередь воркера):
+# столько секунд после окончания блока его ответы ещё принимаются
+BLOCK_SUBMIT_GRACE = 15
+
+
+def _accepts_answers(timing):
+    """Принимает ли блок (BlockTiming) ответы сейчас: идёт или кончился не раньше BLOCK_SUBMIT_GRACE назад."""
+    if timing.state == "running":
+        return True
+    if timing.state == "finished":
+        return datetime.now(timezone.utc) - timing.end <= timedelta(seconds=BLOCK_SUBMIT_GRACE)
+    return False
+
+
+@bp.route("/block/<int:block_id>/answers", methods=["POST"])
+@login_required
+@idempotent
+def api_post_block_answers(block_id):
+    """
+    Ответы сразу на несколько задач блока — автоотправка по окончании времени
+    одним запросом вместо запроса на каждую задачу.
+    {"answers": [{"task_id", "answer"} | {"task_id", "answers": [...]}], "fill_empty": bool}
+    fill_empty — все ещё не отвеченные задачи и примеры блока записываются пустым
+    ответом (уже данные ответы не перезаписываются).
+    Блок должен идти у команды или закончиться не раньше BLOCK_SUBMIT_GRACE
+    секунд назад, иначе 409.
+    """
+    block = block_structure(block_id)
+    if block is None or block.tournament_id != current_user.tournament_id:
+        abort(404)
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("answers", []), list):
+        return jsonify({"ok": False, "error": "Answers must be a list"}), 400
+
+    # пишем только в идущий у этой команды блок (или только что закончившийся)
+    timeline = TeamTimeline.load(current_user, block.tournament_id)
+    if not _accepts_answers(timeline.get(block)):
+        return jsonify({"ok": False, "error": "Block is not running"}), 409
+
+    tasks = {str(task.id): task for task in block.tasks}
+    results = []
+    rows = []
+    touched = {}
+    for item in data.get("answers", []):
+        task_id = item.get("task_id") if isinstance(item, dict) else None
+        task = tasks.get(str(task_id))
+        if task is None:
+            results.append({"task_id": task_id, "error": "Task not found"})
+            continue
+        try:
+            task_rows, result = _grade_task_answers(task, item)
+        except ValueError as e:
+            results.append({"task_id": task.id, "error": str(e)})
+            continue
+        rows.extend(task_rows)
+        touched[task.id] = task
+        results.append({"task_id": task.id, **result})
+
+    missing_rows = []
+    if data.get("fill_empty"):
+        # пустой ответ проверяется так же, как отправленный с формы
+        for task in block.tasks:
+            if task.type == "examples":
+                empty = {"answers": [{"example_id": ex.id, "answer": ""} for ex in task.examples]}
+            else:
+                empty = {"answer": ""}
+            missing_rows.extend(_grade_task_answers(task, empty)[0])
+            touched[task.id] = task
+
+    if not touched:
+        return jsonify({"ok": True, "results": results})
+
+    timeline = _save_answers(block, touched.values(), rows, missing_rows, timeline)
+
+    response_data = {"ok": True, "results": results}
+    response_data.update(_block_completion(timeline, block))
+    return commit_response(jsonify(response_data))
 
 # app/api.py (добавьте в Blueprint bp)
 from collections import defaultdict
@@ -407,13 +505,47 @@ def api_dashboard(tournament_id):
     if not tournament_id:
         return jsonify({"error": "tournament_id required"}), 400
 
-    tournament = Tournament.query.get_or_404(tournament_id)
-    # подготовим структуры задач/примеров для быстрых lookups
-    all_tasks = Task.query.all()
-    task_map = {t.id: t for t in all_tasks}
+    return _scoreboard_json(
+        tournament_id, "teams", lambda: _dashboard_payload(tournament_id), delta=_dashboard_delta
+    )
+
+
+def _scoreboard_json(tournament_id, key, build, delta=None):
+    """Итоговая таблица, если турнир завершён, иначе — таблица текущей версии."""
+    tables = final_tables(tournament_id, final_payloads)
+    if tables is not None and key in tables:
+        return final_json(tournament_id, key, tables[key])
+    return versioned_json(tournament_id, key, build, delta=delta)
+
+
+def final_payloads(tournament):
+    """Все таблицы турнира для заморозки после его завершения: {key: dict}."""
+    full = full_payload(tournament)
+    tables = {
+        "full": full,
+        "overall": full["overall"],
+        "teams": _dashboard_payload(tournament.id),
+    }
+    for data in full["blocks"]:
+        tables[f"block:{data['block']['id']}"] = data
+    return tables
+
+
+def _dashboard_delta(old, new):
+    """?since=: только изменившиеся команды; при смене состава блоков/задач — полный ответ."""
+    if old["blocks"] != new["blocks"]:
+        return None
+    return {"teams": diff_rows(old["teams"], new["teams"], id_field="id")}
+
 
-    all_examples = TaskExample.query.all()
-    example_map = {ex.id: ex for ex in all_examples}
+def _dashboard_payload(tournament_id):
+    # структура турнира из кеша воркера
+    tournament = tournament_structure(tournament_id)
+    if tournament is None:
+        abort(404)
+    # подготовим структуры задач/примеров для быстрых lookups
+    task_map = {t.id: t for b in tournament.blocks for t in b.tasks}
+    example_map = {ex.id: ex for t in task_map.values() for ex in t.examples}
 
     # блоки с их задачами (в порядке)
     blocks = []
@@ -426,10 +558,21 @@ def api_dashboard(tournament_id):
 
     teams = Team.query.filter_by(tournament_id=tournament.id).order_by(Team.name).all()
 
+    # ответы команд турнира по задачам турнира — одним запросом, без ORM-объектов
+    answers_by_team = defaultdict(list)
+    if teams and task_map:
+        answer_rows = db.session.query(
+            Answer.team_id, Answer.task_id, Answer.example_id, Answer.points, Answer.is_correct
+        ).filter(
+            Answer.team_id.in_([team.id for team in teams]),
+            Answer.task_id.in_(list(task_map)),
+        ).all()
+        for a in answer_rows:
+            answers_by_team[a.team_id].append(a)
+
     teams_out = []
     for team in teams:
-        # все ответы этой команды
-        answers = Answer.query.filter_by(team_id=team.id).all()
+        answers = answers_by_team.get(team.id, [])
 
         per_task = defaultdict(int)   # task_id -> points
         # аккумулируем очки по каждому ответу
@@ -479,24 +622,8 @@ def api_dashboard(tournament_id):
             "total": int(total)
         })
 
-    # сортируем по total desc, затем по id для стабильности
-    teams_out.sort(key=lambda x: (-x["total"], x["id"]))
-
-    # вычислим позиции с диапазонами при ничьих (1, 2-4, 5 ...)
-    positions = []
-    i = 0
-    n = len(teams_out)
-    while i < n:
-        j = i
-        while j + 1 < n and teams_out[j + 1]["total"] == teams_out[i]["total"]:
-            j += 1
-        if i == j:
-            pos_str = str(i + 1)
-        else:
-            pos_str = f"{i+1}-{j+1}"
-        for k in range(i, j + 1):
-            teams_out[k]["position"] = pos_str
-        i = j + 1
+    # места с диапазонами при ничьих (1, 2-4, 5 ...), порядок — по total desc, затем по названию
+    rank_rows(teams_out, label_field="position", id_field="id", name_field="login")
 
     response = {
         "tournament": {"id": tournament.id, "name": tournament.name},
@@ -510,194 +637,269 @@ def api_dashboard(tournament_id):
         "teams": teams_out,
         "generated_at": datetime.now(timezone.utc).isoformat()
     }
-    return jsonify(response)
+    return response
 
 @bp.route("/dashboard/block/<int:block_id>", methods=["GET"])
 def get_dashboard_block(block_id):
-    block = TaskBlock.query.get_or_404(block_id)
+    key = f"block:{block_id}"
+    tournament_id = final_block_tournament(block_id)
+    if tournament_id is not None:
+        tables = final_tables(tournament_id, final_payloads)
+        if tables is not None and key in tables:
+            return final_json(tournament_id, key, tables[key])
 
-    tasks = list(block.tasks)
-    # ТОЛЬКО команды, зарегистрированные на турнир этого блока
-    teams = Team.query.filter_by(tournament_id=block.tournament_id).order_by(Team.name).all()
+    block = block_structure(block_id)
+    if block is None:
+        abort(404)
+    return _scoreboard_json(block.tournament_id, key, lambda: _block_payload(block))
 
-    task_examples = {}
-    for t in tasks:
-        if getattr(t, "type", "single") == "examples":
-            examples = TaskExample.query.filter_by(task_id=t.id).order_by(TaskExample.id).all()
-            task_examples[t.id] = [{"id": ex.id, "text": ex.text, "points": getattr(ex, "points", None)} for ex in examples]
-        else:
-            task_examples[t.id] = []
-
-    rows = []
-    for team in teams:
-        cells = []
-        total = 0
-        for t in tasks:
-            if t.type == "examples":
-                examples = TaskExample.query.filter_by(task_id=t.id).order_by(TaskExample.id).all()
-                total_examples = len(examples)
-                ans_list = Answer.query.filter_by(team_id=team.id, task_id=t.id).all()
-                by_ex = {a.example_id: a for a in ans_list if a.example_id is not None}
-                if len(by_ex) == 0:
-                    cells.append({"state": "no-answer", "points": None})
-                else:
-                    correct_count = 0
-                    points_sum = 0
-                    for ex in examples:
-                        a = by_ex.get(ex.id)
-                        if a and getattr(a, "is_correct", False):
-                            correct_count += 1
-                        if a:
-                            points_sum += getattr(a, "points", 0) or 0
-                    total += points_sum
-                    if total_examples > 0 and correct_count == total_examples:
-                        cells.append({"state": "correct", "points": points_sum})
-                    elif correct_count > 0:
-                        cells.append({"state": "partial", "points": points_sum})
-                    else:
-                        cells.append({"state": "wrong", "points": points_sum})
-            else:
-                a = Answer.query.filter_by(team_id=team.id, task_id=t.id, example_id=None).first()
-                if not a:
-                    cells.append({"state": "no-answer", "points": None})
-                else:
-                    pts = getattr(a, "points", 0) or 0
-                    total += pts
-                    if getattr(a, "is_correct", False):
-                        cells.append({"state": "correct", "points": pts})
-                    else:
-                        cells.append({"state": "wrong", "points": pts})
-
-        # используем название команды
-        team_name = team.name or f"Team #{team.id}"
-
-        rows.append({
-            "team_id": team.id,
-            "team_name": team_name,
-            "member1": team.member1,
-            "member2": team.member2,
-            "member3": team.member3,
-            "cells": cells,
-            "total": total
-        })
 
-
-    # сорт и rank labels (как было)
-    rows.sort(key=lambda r: (-r["total"], r["team_name"]))
-    # ... (вставь код генерации rank_label, идентичный твоему предыдущему)
-    # для краткости — скопируй существующую реализацию меток мест (она у тебя уже есть)
-    # затем:
-    # return jsonify({...})
-    # Ниже возвращаем структуру точно так же, как раньше:
-    # для сохранения — положим реализацию label-логику из твоего файла (не меняется)
-    # --------------------------
-
-    # compute rank labels (same logic as earlier)
-    rank_labels = {}
-    if rows:
-        last_score = None
-        start_idx = 0
-        for idx, r in enumerate(rows):
-            if last_score is None:
-                last_score = r["total"]
-                start_idx = 0
-            elif r["total"] != last_score:
-                if start_idx == idx - 1:
-                    rank_labels[(start_idx, idx - 1)] = str(start_idx + 1)
-                else:
-                    rank_labels[(start_idx, idx - 1)] = f"{start_idx + 1}-{idx}"
-                last_score = r["total"]
-                start_idx = idx
-        n = len(rows)
-        if start_idx == n - 1:
-            rank_labels[(start_idx, n - 1)] = str(start_idx + 1)
-        else:
-            rank_labels[(start_idx, n - 1)] = f"{start_idx + 1}-{n}"
-    labels = []
-    for (s, e), label in rank_labels.items():
-        for i in range(s, e + 1):
-            labels.append((i, label))
-    idx_to_label = {i: lab for i, lab in labels}
-    for idx, r in enumerate(rows):
-        r["rank_label"] = idx_to_label.get(idx, str(idx + 1))
-
-    return jsonify({
-        "block": {"id": block.id, "name": block.name},
-        "tasks": [{"id": t.id, "title": t.title, "type": t.type, "points": getattr(t, "points", None)} for t in tasks],
-        "rows": rows
-    })
+def _block_payload(block):
+    # ТОЛЬКО команды, зарегистрированные на турнир этого блока (см. scoreboard.block_table)
+    data = block_table(block)
+    return block_json(block, data["tasks"], data["rows"])
 
 
 @bp.route("/dashboard/overall/<int:tournament_id>", methods=["GET"])
 def get_dashboard_overall(tournament_id):
-    tournament = Tournament.query.get_or_404(tournament_id)
-    blocks = list(tournament.blocks)
-    teams = Team.query.filter_by(tournament_id=tournament.id).order_by(Team.name).all()
+    return _scoreboard_json(tournament_id, "overall", lambda: _overall_payload(tournament_id))
 
-    rows = []
-    for team in teams:
-        cells = []
-        total = 0
-        for block in blocks:
-            pts_block = 0
-            any_answer = False
-            for t in block.tasks:
-                if t.type == "examples":
-                    answers = Answer.query.filter(Answer.team_id == team.id, Answer.task_id == t.id, Answer.example_id.isnot(None)).all()
-                    if answers:
-                        any_answer = True
-                        pts_block += sum(getattr(a, "points", 0) or 0 for a in answers)
-                else:
-                    a = Answer.query.filter_by(team_id=team.id, task_id=t.id, example_id=None).first()
-                    if a:
-                        any_answer = True
-                        pts_block += getattr(a, "points", 0) or 0
-            cells.append({"points": pts_block, "answered": any_answer})
-            total += pts_block
-        team_name = team.name or f"Team #{team.id}"
-        rows.append({
-            "team_id": team.id,
-            "team_name": team_name,
-            "member1": team.member1,
-            "member2": team.member2,
-            "member3": team.member3,
-            "cells": cells,
-            "total": total
-        })
 
+def _overall_payload(tournament_id):
+    tournament = structure_or_404(tournament_id)
+    blocks = list(tournament.blocks)
+    # агрегаты по блокам читаются из team_scores одним запросом
+    rows = overall_rows(tournament)
 
-    rows.sort(key=lambda r: (-r["total"], r["team_name"]))
-    # compute rank labels same as above
-    rank_labels = {}
-    if rows:
-        last_score = None
-        start_idx = 0
-        for idx, r in enumerate(rows):
-            if last_score is None:
-                last_score = r["total"]
-                start_idx = 0
-            elif r["total"] != last_score:
-                if start_idx == idx - 1:
-                    rank_labels[(start_idx, idx - 1)] = str(start_idx + 1)
-                else:
-                    rank_labels[(start_idx, idx - 1)] = f"{start_idx + 1}-{idx}"
-                last_score = r["total"]
-                start_idx = idx
-        n = len(rows)
-        if start_idx == n - 1:
-            rank_labels[(start_idx, n - 1)] = str(start_idx + 1)
-        else:
-            rank_labels[(start_idx, n - 1)] = f"{start_idx + 1}-{n}"
-    labels = []
-    for (s, e), label in rank_labels.items():
-        for i in range(s, e + 1):
-            labels.append((i, label))
-    idx_to_label = {i: lab for i, lab in labels}
-    for idx, r in enumerate(rows):
-        r["rank_label"] = idx_to_label.get(idx, str(idx + 1))
+    rank_rows(rows)
 
-    return jsonify({
+    return {
         "tournament": {"id": tournament.id, "name": tournament.name},
         "blocks": [{"id": b.id, "name": b.name} for b in blocks],
         "rows": rows
-    })
+    }
+
+
+@bp.route("/dashboard/<int:tournament_id>/full", methods=["GET"])
+def get_dashboard_full(tournament_id):
+    """
+    Общая таблица и таблицы всех блоков одним ответом — из одной матрицы ответов,
+    поэтому все таблицы соответствуют одному и тому же моменту.
+    """
+    return _scoreboard_json(
+        tournament_id, "full", lambda: _full_payload(tournament_id), delta=_full_delta
+    )
+
+
+def _full_delta(old, new):
+    """?since=: изменения по таблицам в том же виде, что и delta-событие SSE."""
+    return {"tables": _tables_delta(_split_tables(old), _split_tables(new))}
+
+
+def _split_tables(full):
+    """Полный ответ табло -> {"overall": ..., "block:<id>": ...}."""
+    out = {"overall": full["overall"]}
+    for data in full["blocks"]:
+        out[f"block:{data['block']['id']}"] = data
+    return out
+
+
+def _tables_delta(current, fresh):
+    """Изменившиеся таблицы; новые таблицы передаются целиком (с порядком)."""
+    changes = {}
+    for key, data in fresh.items():
+        delta = diff_rows(current[key]["rows"], data["rows"]) if key in current else None
+        if delta is None:
+            changes[key] = {"rows": data["rows"], "removed": [], "order": [r["team_id"] for r in data["rows"]]}
+        elif delta["rows"] or delta["removed"] or "order" in delta:
+            changes[key] = delta
+    return changes
+
+
+def _full_payload(tournament_id):
+    return full_payload(structure_or_404(tournament_id))
+
+
+def structure_or_404(tournament_id):
+    """TournamentInfo турнира (см. app/catalog.py) или 404."""
+    tournament = tournament_structure(tournament_id)
+    if tournament is None:
+        abort(404)
+    return tournament
+
+
+# SSE: раз в STREAM_PING секунд шлём комментарий, чтобы прокси не рвал соединение;
+# через STREAM_MAX_AGE поток закрывается, и EventSource переподключается сам
+STREAM_PING = 15
+STREAM_MAX_AGE = 30 * 60
+# через сколько секунд клиенту, не получившему поток, стоит попробовать снова
+STREAM_RETRY_AFTER = 60
+
+
+class _StreamSlots:
+    """Счётчик открытых SSE-потоков воркера (лимит — SSE_STREAMS_PER_WORKER)."""
+
+    def __init__(self):
+        self.open = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit):
+        with self._lock:
+            if self.open >= limit:
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+
+_stream_slots = _StreamSlots()
+
+
+def _stream_response(generate, sub):
+    """
+    Ответ text/event-stream с подпиской sub или 503, если в воркере уже
+    SSE_STREAMS_PER_WORKER потоков: EventSource на ошибку закрывается, и
+    страница переходит на опрос.
+    """
+    if not _stream_slots.acquire(current_app.config["SSE_STREAMS_PER_WORKER"]):
+        sub.close()
+        resp = jsonify({"error": "Too many streams, use polling"})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(STREAM_RETRY_AFTER)
+        return resp
+    resp = current_app.response_class(generate(), mimetype="text/event-stream")
+    # слот и подписка освобождаются при закрытии ответа — даже если генератор так
+    # и не начался (клиент ушёл сразу) и его finally не выполнится. Ушедшего
+    # клиента сервер замечает только на записи, т.е. через один-два STREAM_PING
+    resp.call_on_close(_stream_slots.release)
+    resp.call_on_close(sub.close)
+    resp.headers["Cache-Control"] = "no-cache"
+    # nginx не должен буферизовать поток
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+def _sse(event, data, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@bp.route("/dashboard/<int:tournament_id>/stream", methods=["GET"])
+def dashboard_stream(tournament_id):
+    """
+    Server-Sent Events для табло: сначала snapshot со всеми таблицами
+    (общая + по блокам), затем delta с изменившимися строками/местами
+    после каждого commit, меняющего score_version турнира.
+    """
+    structure_or_404(tournament_id)
+    sub = subscribe(SCOREBOARD_CHANNEL, tournament_id)
+
+    def tables(version):
+        version, body = cached_body(tournament_id, "full", version, lambda: _full_payload(tournament_id))
+        return version, _split_tables(json.loads(body))
+
+    @stream_with_context
+    def generate():
+        try:
+            version, current = tables(current_score_version(tournament_id))
+            # соединение с БД не держим, пока поток ждёт событий
+            db.session.close()
+            yield "retry: 3000\n\n"
+            yield _sse("snapshot", {"version": version, "tables": current}, version)
+
+            deadline = time.monotonic() + STREAM_MAX_AGE
+            while time.monotonic() < deadline:
+                if sub.get(timeout=STREAM_PING) is None:
+                    yield ": ping\n\n"
+                    continue
+                new_version = current_score_version(tournament_id)
+                if new_version is None or new_version == version:
+                    db.session.close()
+                    continue
+                new_version, fresh = tables(new_version)
+                db.session.close()
+
+                changes = _tables_delta(current, fresh)
+                version, current = new_version, fresh
+                if changes:
+                    yield _sse("delta", {"version": version, "tables": changes}, version)
+        finally:
+            sub.close()
+            db.session.close()
+
+    return _stream_response(generate, sub)
+
+
+@bp.route("/tournament/<int:tid>/events", methods=["GET"])
+@login_required
+def team_stream(tid):
+    """
+    Server-Sent Events для страницы команды вместо опроса /status: сначала status
+    (как /api/tournament/<id>/status), затем при переходах команды —
+    block_finished (с next_block_id, если следующий блок можно начать),
+    block_started и time_adjusted (сменился конец идущего блока).
+    """
+    if current_user.tournament_id != tid:
+        return jsonify({"error": "Team is not registered for this tournament"}), 404
+    team_id = current_user.id
+    sub = subscribe(TEAM_CHANNEL, team_id)
+
+    def fresh_status(team):
+        # поток — один долгий запрос: кеш запроса (memo) не должен держать старое время блоков
+        invalidate("timeline")
+        status = team_status(team, tid)
+        db.session.close()
+        return status
+
+    @stream_with_context
+    def generate():
+        try:
+            team = current_user._get_current_object()
+            status = fresh_status(team)
+            yield "retry: 3000\n\n"
+            yield _sse("status", status.as_dict(datetime.now(timezone.utc)), status.version)
+
+            deadline = time.monotonic() + STREAM_MAX_AGE
+            while time.monotonic() < deadline:
+                # просыпаемся и к концу идущего блока — даже если событие о нём не придёт
+                wait = STREAM_PING
+                if status.deadline is not None:
+                    left = (status.deadline - datetime.now(timezone.utc)).total_seconds()
+                    wait = min(wait, max(left, 0) + 0.5)
+                if sub.get(timeout=wait) is not None:
+                    team = db.session.get(Team, team_id)
+                    if team is None:
+                        return
+                fresh = fresh_status(team)
+                events = _team_events(status, fresh)
+                if not events:
+                    yield ": ping\n\n"
+                previous = status.active_block_id if status.state == "running" else None
+                data = dict(fresh.as_dict(datetime.now(timezone.utc)), previous_block_id=previous)
+                for event in events:
+                    yield _sse(event, data, fresh.version)
+                status = fresh
+        finally:
+            sub.close()
+            db.session.close()
+
+    return _stream_response(generate, sub)
+
+
+def _team_events(old, new):
+    """Имена SSE-событий для перехода состояния команды old -> new (TeamStatus)."""
+    if old.state == "running" and (new.state != "running" or new.active_block_id != old.active_block_id):
+        events = ["block_finished"]
+        if new.state == "running":
+            events.append("block_started")
+        return events
+    if new.state == "running" and (old.state != "running" or new.active_block_id != old.active_block_id):
+        return ["block_started"]
+    if new.state == "running" and new.deadline != old.deadline:
+        return ["time_adjusted"]
+    if new.version != old.version or new.state != old.state or new.active_block_id != old.active_block_id:
+        return ["status"]
+    return []
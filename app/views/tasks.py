@@ -4,11 +4,20 @@ import os
 from flask_login import login_required, current_user
 from ..models import Task, Answer, TaskBlock, Tournament, TeamBlockStart
 from ..extensions import db
+from ..snapshots import bump_score_version
+from ..catalog import tournament_structure, block_structure
+from ..expiry import announce_block_start
+from ..idempotency import commit_response, idempotent
+from ..utils import TeamTimeline
 from datetime import datetime, timezone
 from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 bp = Blueprint("tasks", __name__)
 
+# сколько раз вставлять начало блока, если конфликтующую запись тут же удалил сброс
+START_BLOCK_ATTEMPTS = 3
+
 # ---- routes ----
 
 @bp.route("/")
@@ -31,7 +40,7 @@ def waiting():
     next_block_id = request.args.get("next_block_id", type=int)
 
     if tid:
-        tournament = Tournament.query.get(tid)
+        tournament = tournament_structure(tid)
         if tournament:
             # Инициализируем started_at если еще не установлено
             if not current_user.started_at:
@@ -40,7 +49,7 @@ def waiting():
             
             # Если передан next_block_id, проверяем его существование и принадлежность
             if next_block_id:
-                next_block = TaskBlock.query.get(next_block_id)
+                next_block = tournament.block(next_block_id)
                 if next_block and next_block.tournament_id == tournament.id:
                     return render_template("waiting.html", tournament=tournament, 
                                          next_block=next_block, server_time=datetime.now(timezone.utc).isoformat())
@@ -62,7 +71,7 @@ def tournament(tournament_id):
     if not tournament_id:
         return abort(400, description="tournament_id required")
 
-    tournament = Tournament.query.get(tournament_id)
+    tournament = tournament_structure(tournament_id)
 
     # нет турнира — возвращаем на waiting
     if not tournament:
@@ -73,11 +82,11 @@ def tournament(tournament_id):
         current_user.started_at = datetime.now(timezone.utc)
         db.session.commit()
 
-    blocks = sorted(list(tournament.blocks), key=lambda b: (b.order or 0, b.id))
+    blocks = list(tournament.blocks)
 
     # Получаем активный блок
-    from ..utils import get_team_active_block
-    active_block = get_team_active_block(current_user, tournament)
+    timeline = TeamTimeline.load(current_user, tournament.id)
+    active_block = timeline.active.block if timeline.active else None
     
     if active_block:
         # Если есть активный блок, рендерим страницу турнира в обычном режиме
@@ -92,11 +101,7 @@ def tournament(tournament_id):
     pending_block = None
     if blocks:
         for block in blocks:
-            block_start = TeamBlockStart.query.filter_by(
-                team_id=current_user.id,
-                block_id=block.id
-            ).first()
-            if not block_start:
+            if timeline.start_row(block) is None:
                 pending_block = block
                 break
 
@@ -116,6 +121,7 @@ def tournament(tournament_id):
 
 @bp.route("/start_block", methods=["POST"])
 @login_required
+@idempotent
 def start_block():
     """
     Устанавливает время начала блока для команды.
@@ -126,7 +132,7 @@ def start_block():
     if not block_id:
         return jsonify({"ok": False, "error": "block_id required"}), 400
     
-    block = TaskBlock.query.get(block_id)
+    block = block_structure(block_id)
     if not block:
         return jsonify({"ok": False, "error": "Block not found"}), 404
     
@@ -134,26 +140,37 @@ def start_block():
     if block.tournament_id != current_user.tournament_id:
         return jsonify({"ok": False, "error": "Block does not belong to team's tournament"}), 403
     
-    # Проверяем, не начат ли блок уже
-    existing = TeamBlockStart.query.filter_by(
-        team_id=current_user.id,
-        block_id=block_id
-    ).first()
-    
-    if existing:
+    # Устанавливаем время начала блока одним INSERT: при двойном нажатии или
+    # одновременном старте с другого устройства запись уже есть (uq_team_block_start)
+    for _ in range(START_BLOCK_ATTEMPTS):
+        started_at = db.session.execute(
+            pg_insert(TeamBlockStart).values(
+                team_id=current_user.id,
+                block_id=block.id,
+                started_at=datetime.now(timezone.utc)
+            ).on_conflict_do_nothing(
+                constraint="uq_team_block_start"
+            ).returning(TeamBlockStart.started_at)
+        ).scalar()
+        if started_at is not None:
+            break
+
         # Блок уже начат
-        return jsonify({"ok": True, "already_started": True, "started_at": existing.started_at.isoformat()})
-    
-    # Устанавливаем время начала блока
-    block_start = TeamBlockStart(
-        team_id=current_user.id,
-        block_id=block_id,
-        started_at=datetime.now(timezone.utc)
-    )
-    db.session.add(block_start)
-    db.session.commit()
-    
-    return jsonify({"ok": True, "started_at": block_start.started_at.isoformat()})
+        existing = db.session.query(TeamBlockStart.started_at).filter_by(
+            team_id=current_user.id,
+            block_id=block.id
+        ).scalar()
+        if existing is not None:
+            db.session.rollback()
+            return jsonify({"ok": True, "already_started": True, "started_at": existing.isoformat()})
+        # запись удалил сброс команды или ответов между INSERT и чтением — пробуем снова
+    else:
+        db.session.rollback()
+        return jsonify({"ok": False, "error": "Block start conflicted with a reset, try again"}), 409
+
+    announce_block_start(current_user.id, block, started_at)
+    bump_score_version(block.tournament_id, [current_user.id])
+    return commit_response(jsonify({"ok": True, "started_at": started_at.isoformat()}))
 
 @bp.route('/favicon.ico')
 def favicon():
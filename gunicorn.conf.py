@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+# Воркеры gevent: каждое соединение — гринлет, поэтому долгие SSE-потоки табло и
+# страницы команды (/api/dashboard/<id>/stream, /api/tournament/<id>/events)
+# стоят по гринлету, а не по потоку ОС. Потоки приложения (слушатель
+# LISTEN/NOTIFY, планировщик окончания блоков) после monkey-patch тоже гринлеты.
+#
+# psycopg2 ждёт ответа PostgreSQL в C-коде и остановил бы весь воркер —
+# psycogreen переключает это ожидание на цикл событий gevent.
+#
+# Бюджет соединений: WEB_CONCURRENCY воркеров x WORKER_CONNECTIONS клиентских
+# соединений; с PostgreSQL — не больше DB_POOL_SIZE + DB_MAX_OVERFLOW на воркер
+# (см. app/config.py) плюс слушатель событий в каждом и соединение лидера
+# планировщика. Потоки SSE соединение с БД между событиями не держат.
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "gevent"
+worker_connections = int(os.getenv("WORKER_CONNECTIONS", "1000"))
+
+
+def post_fork(server, worker):
+    from psycogreen.gevent import patch_psycopg
+
+    patch_psycopg()
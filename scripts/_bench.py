@@ -0,0 +1,112 @@
+# scripts/_bench.py
+# Общее для скриптов нагрузки из scripts/: пустая БД, команды, счётчик SQL-запросов
+# и параллельный запуск клиентов.
+#
+# Скрипты работают с отдельной базой BENCH_DATABASE_URL — схема public в ней
+# пересоздаётся миграциями, — и ходят в приложение через Flask test client из
+# нескольких потоков (без gunicorn и сети: меряется работа приложения и БД).
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def scratch_app():
+    """Приложение на пустой БД BENCH_DATABASE_URL со схемой по миграциям."""
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("BENCH_DATABASE_URL is not set (a scratch PostgreSQL database: its schema is recreated)")
+    os.environ["DATABASE_URL"] = url
+    os.environ["BLOCK_EXPIRY_SCHEDULER"] = "0"
+
+    from flask_migrate import upgrade
+    from sqlalchemy import text
+    from app import create_app
+    from app.extensions import db
+
+    app = create_app()
+    app.config.update(SESSION_COOKIE_SECURE=False)
+    with app.app_context():
+        db.session.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public"))
+        db.session.commit()
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+    return app
+
+
+def add_teams(tournament_id, n, prefix="Team"):
+    """n команд турнира с паролем "p" (нужен app context). Возвращает их названия."""
+    from app.extensions import db
+    from app.models import Team
+
+    names = [f"{prefix} {tournament_id}-{i}" for i in range(n)]
+    # хеш пароля медленный намеренно — считаем его один раз на всех
+    template = Team()
+    template.set_password("p")
+    for name in names:
+        db.session.add(Team(name=name, member1="m", tournament_id=tournament_id, password_hash=template.password_hash))
+    db.session.commit()
+    return names
+
+
+def login(app, name):
+    client = app.test_client()
+    response = client.post("/auth/login", data={"team_name": name, "password": "p"})
+    if response.status_code != 302:
+        raise RuntimeError(f"login {name!r} failed: {response.status_code}")
+    return client
+
+
+class QueryCounter:
+    """Число SQL-запросов к движку приложения (из всех потоков)."""
+
+    def __init__(self, app):
+        from sqlalchemy import event
+        from app.extensions import db
+
+        self.count = 0
+        self._lock = threading.Lock()
+        with app.app_context():
+            event.listen(db.engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+def run_parallel(fn, items, threads):
+    """
+    fn(item) для каждого item в threads потоках.
+    Возвращает (результаты, время каждого вызова в секундах, общее время).
+    """
+    def timed(item):
+        started = time.perf_counter()
+        result = fn(item)
+        return result, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        done = list(pool.map(timed, items))
+    wall = time.perf_counter() - started
+    return [r for r, _ in done], [t for _, t in done], wall
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def report(label, latencies, wall, queries, requests):
+    print(
+        f"{label:<28} requests={requests:<6} queries={queries:<7} wall={wall * 1000:8.1f} ms  "
+        f"p50={percentile(latencies, 50) * 1000:7.1f} ms  p95={percentile(latencies, 95) * 1000:7.1f} ms"
+    )
@@ -0,0 +1,102 @@
+# scripts/bench_dashboard.py
+# Стоимость таблиц результатов одного турнира при росте числа других турниров.
+#
+# Табло и каталог турнира читают только его блоки, задачи, команды и очки, поэтому
+# число запросов и время не должны зависеть от того, сколько в базе других
+# (параллельных и архивных) турниров с командами и ответами. Скрипт заполняет базу
+# ступенями и на каждой меряет холодную сборку: перед каждым запросом поднимаются
+# content_version и score_version — структура турнира и таблицы не берутся из кеша.
+#
+#   BENCH_DATABASE_URL=postgresql://postgres@localhost/triathlon_bench \
+#       python scripts/bench_dashboard.py --steps 0,50,200 --teams 30
+import argparse
+import statistics
+import time
+from _bench import QueryCounter, add_teams, scratch_app
+
+# ответ на каждый слот (задача целиком или пример) всех команд турниров ids
+_FILL_ANSWERS = """
+    INSERT INTO answers (team_id, task_id, example_id, answer_text, is_correct, points, submitted_at)
+    SELECT teams.id, tasks.id, task_examples.id, '1', true, 1, now()
+    FROM teams
+    JOIN task_blocks ON task_blocks.tournament_id = teams.tournament_id
+    JOIN tasks ON tasks.block_id = task_blocks.id
+    LEFT JOIN task_examples ON task_examples.task_id = tasks.id
+    WHERE teams.tournament_id = ANY(:ids)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--steps", default="0,50,200", help="other tournaments in the database at each step")
+    parser.add_argument("--teams", type=int, default=30, help="teams per tournament")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    steps = [int(s) for s in args.steps.split(",")]
+
+    app = scratch_app()
+    from sqlalchemy import text
+    from app.catalog import bump_content_version, load_tournament_catalog, tournament_structure
+    from app.extensions import db
+    from app.models import Answer, Tournament, create_tour
+    from app.scoreboard import rebuild_task_scores
+    from app.snapshots import bump_score_version
+
+    def add_tournaments(count):
+        """Дописывает турниры (по 5 за create_tour) с командами и ответами; возвращает их id."""
+        known = {tid for (tid,) in db.session.query(Tournament.id)}
+        while db.session.query(Tournament.id).count() - len(known) < count:
+            create_tour()
+        new = sorted({tid for (tid,) in db.session.query(Tournament.id)} - known)
+        for tournament_id in new:
+            add_teams(tournament_id, args.teams)
+        db.session.execute(text(_FILL_ANSWERS), {"ids": new})
+        rebuild_task_scores([task for tid in new for block in tournament_structure(tid).blocks for task in block.tasks])
+        db.session.commit()
+        return new
+
+    with app.app_context():
+        target = add_tournaments(1)[0]
+        others = 0
+    counter = QueryCounter(app)
+    client = app.test_client()
+    urls = [f"/api/dashboard/{target}", f"/api/dashboard/{target}/full", f"/api/dashboard/overall/{target}"]
+
+    print(f"target tournament {target}: {args.teams} teams; cold build, median of {args.repeat}")
+    for step in steps:
+        with app.app_context():
+            if step > others:
+                add_tournaments(step - others)
+            others = db.session.query(Tournament.id).count() - 1
+            answers = db.session.query(Answer.id).count()
+        print(f"-- {others} other tournaments, {answers} answers in the database")
+
+        timings, queries = [], 0
+        for _ in range(args.repeat):
+            with app.app_context():
+                counter.reset()
+                started = time.perf_counter()
+                load_tournament_catalog(target)
+                timings.append(time.perf_counter() - started)
+                queries = counter.count
+                db.session.remove()
+        print(f"   {'load_tournament_catalog':<32} queries={queries:<4} median={statistics.median(timings) * 1000:7.1f} ms")
+
+        for url in urls:
+            timings = []
+            for _ in range(args.repeat):
+                with app.app_context():
+                    bump_content_version(target)
+                    bump_score_version(target)
+                    db.session.commit()
+                counter.reset()
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append(time.perf_counter() - started)
+                queries = counter.count
+                assert response.status_code == 200, (url, response.status_code)
+            print(f"   GET {url:<28} queries={queries:<4} median={statistics.median(timings) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
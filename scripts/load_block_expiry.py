@@ -0,0 +1,76 @@
+# scripts/load_block_expiry.py
+# Нагрузка в момент окончания времени блока: у всех команд таймер истекает
+# одновременно, и каждая вкладка автоматически отправляет ответы.
+#
+# Сравнивает прежнюю автоотправку (POST /api/task/<id> по очереди на каждую
+# задачу блока) и одну отправку блока целиком (POST /api/block/<id>/answers).
+#
+#   BENCH_DATABASE_URL=postgresql://postgres@localhost/triathlon_bench \
+#       python scripts/load_block_expiry.py --teams 200 --threads 8
+import argparse
+from datetime import datetime, timezone
+from _bench import QueryCounter, add_teams, login, report, run_parallel, scratch_app
+
+
+def task_payload(task):
+    if task.type == "examples":
+        return {"answers": [{"example_id": ex.id, "answer": "1"} for ex in task.examples]}
+    return {"answer": "1"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--teams", type=int, default=100)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    app = scratch_app()
+    from app.catalog import tournament_structure
+    from app.extensions import db
+    from app.models import Answer, IdempotencyKey, Team, TeamBlockStart, TeamScore, Tournament, create_tour
+
+    with app.app_context():
+        create_tour()
+        tournament_id = db.session.query(Tournament.id).order_by(Tournament.id).limit(1).scalar()
+        names = add_teams(tournament_id, args.teams)
+        block = min(tournament_structure(tournament_id).blocks, key=lambda b: b.order)
+        tasks = list(block.tasks)
+    clients = [login(app, name) for name in names]
+    counter = QueryCounter(app)
+    print(f"{args.teams} teams, block {block.name!r}: {len(tasks)} tasks, {args.threads} threads")
+
+    def start_block():
+        # первый блок у всех команд идёт с этого момента; прежних ответов нет
+        with app.app_context():
+            Answer.query.delete()
+            TeamScore.query.delete()
+            IdempotencyKey.query.delete()
+            TeamBlockStart.query.delete()
+            Team.query.update({Team.started_at: datetime.now(timezone.utc)})
+            db.session.commit()
+
+    def per_task(client):
+        for task in tasks:
+            response = client.post(f"/api/task/{task.id}", json=task_payload(task))
+            assert response.status_code == 200, response.status_code
+
+    def bulk(client):
+        answers = [dict(task_payload(task), task_id=task.id) for task in tasks]
+        response = client.post(f"/api/block/{block.id}/answers", json={"answers": answers, "fill_empty": True})
+        assert response.status_code == 200, response.status_code
+
+    for label, submit, per_team in (
+        ("per-task POST /api/task", per_task, len(tasks)),
+        ("one POST /api/block/answers", bulk, 1),
+    ):
+        start_block()
+        counter.reset()
+        _, latencies, wall = run_parallel(submit, clients, args.threads)
+        report(label, latencies, wall, counter.count, per_team * len(clients))
+        with app.app_context():
+            answered = db.session.query(Answer.team_id).distinct().count()
+        assert answered == len(clients), answered
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# scripts/stress_start_block.py
+# Гонки старта и окончания блока: одна команда жмёт "Начать блок" с нескольких
+# устройств одновременно, таймер и последний ответ закрывают блок в один момент.
+#
+# Проверяет, что на каждую пару (команда, блок) остаётся одна запись
+# team_block_start, ровно один запрос старта получает свежий старт (остальные —
+# already_started с тем же временем), 5xx нет, а окончание записывается один раз.
+#
+#   BENCH_DATABASE_URL=postgresql://postgres@localhost/triathlon_bench \
+#       python scripts/stress_start_block.py --teams 10 --devices 4
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from _bench import QueryCounter, add_teams, login, report, run_parallel, scratch_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--teams", type=int, default=10)
+    parser.add_argument("--devices", type=int, default=4, help="parallel requests per team")
+    args = parser.parse_args()
+
+    app = scratch_app()
+    from sqlalchemy import func
+    from app.catalog import tournament_structure
+    from app.extensions import db
+    from app.models import Team, TeamBlockStart, Tournament, create_tour
+    from app.utils import finish_team_block
+
+    with app.app_context():
+        create_tour()
+        tournament_id = db.session.query(Tournament.id).order_by(Tournament.id).limit(1).scalar()
+        names = add_teams(tournament_id, args.teams)
+        first, second = sorted(tournament_structure(tournament_id).blocks, key=lambda b: b.order)[:2]
+        Team.query.update({Team.started_at: datetime.now(timezone.utc)})
+        db.session.commit()
+        team_ids = dict(db.session.query(Team.name, Team.id))
+    counter = QueryCounter(app)
+
+    # старт второго блока: devices запросов на команду, все одновременно
+    devices = [(name, login(app, name)) for name in names for _ in range(args.devices)]
+    barrier = threading.Barrier(len(devices))
+
+    def start(device):
+        name, client = device
+        barrier.wait()
+        response = client.post("/start_block", json={"block_id": second.id})
+        return name, response.status_code, response.get_json(silent=True) or {}
+
+    counter.reset()
+    results, latencies, wall = run_parallel(start, devices, len(devices))
+    report("parallel /start_block", latencies, wall, counter.count, len(devices))
+
+    by_team = defaultdict(list)
+    for name, status, body in results:
+        assert status == 200, (name, status, body)
+        by_team[name].append(body)
+    for name, bodies in by_team.items():
+        fresh = [b for b in bodies if not b.get("already_started")]
+        assert len(fresh) == 1, (name, bodies)
+        assert len({b["started_at"] for b in bodies}) == 1, (name, bodies)
+
+    # окончание первого блока: таймаут и последний ответ одновременно
+    barrier = threading.Barrier(len(devices))
+
+    def finish(device):
+        name, _ = device
+        with app.app_context():
+            barrier.wait()
+            now = datetime.now(timezone.utc)
+            row = finish_team_block(team_ids[name], first, now, now, "timeout")
+            db.session.commit()
+            return name, row.finished_at
+
+    counter.reset()
+    results, latencies, wall = run_parallel(finish, devices, len(devices))
+    report("parallel finish_team_block", latencies, wall, counter.count, len(devices))
+    finished = defaultdict(set)
+    for name, finished_at in results:
+        finished[name].add(finished_at)
+    assert all(len(times) == 1 for times in finished.values()), finished
+
+    with app.app_context():
+        duplicates = db.session.query(TeamBlockStart.team_id, TeamBlockStart.block_id).group_by(
+            TeamBlockStart.team_id, TeamBlockStart.block_id
+        ).having(func.count() > 1).all()
+        rows = db.session.query(func.count(TeamBlockStart.id)).scalar()
+    assert not duplicates, duplicates
+    assert rows == 2 * args.teams, rows
+    print(f"ok: {rows} team_block_start rows for {args.teams} teams x 2 blocks, one fresh start and one finish per team")
+
+
+if __name__ == "__main__":
+    main()
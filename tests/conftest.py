@@ -0,0 +1,76 @@
+# tests/conftest.py
+# Тесты с БД запускаются, только если задан TEST_DATABASE_URL — отдельная
+# PostgreSQL-база для тестов: схема public в ней пересоздаётся миграциями.
+#
+#   TEST_DATABASE_URL=postgresql://postgres@localhost/triathlon_test python -m pytest -q tests
+import os
+import pytest
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+if TEST_DATABASE_URL:
+    # Config читает окружение при импорте app
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+os.environ["BLOCK_EXPIRY_SCHEDULER"] = "0"
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_KEY = "secret"
+
+
+@pytest.fixture(scope="session")
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from flask_migrate import upgrade
+    from sqlalchemy import text
+    from app import create_app
+    from app.extensions import db
+
+    app = create_app()
+    app.config.update(TESTING=True, SESSION_COOKIE_SECURE=False)
+    with app.app_context():
+        db.session.execute(text("DROP SCHEMA public CASCADE; CREATE SCHEMA public"))
+        db.session.commit()
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+    return app
+
+
+@pytest.fixture
+def db(app):
+    """Сессия БД в app context; после теста таблицы очищаются (id не переиспользуются)."""
+    from sqlalchemy import text
+    from app.extensions import db
+
+    with app.app_context():
+        yield db
+        db.session.remove()
+        tables = [t.name for t in db.metadata.sorted_tables]
+        db.session.execute(text(f"TRUNCATE {', '.join(tables)} CASCADE"))
+        db.session.commit()
+        db.session.remove()
+
+
+@pytest.fixture
+def tournament(db):
+    """Турнир из двух блоков (по 10 минут) и двух команд; первый блок команды идёт с team.started_at."""
+    from app.models import Tournament, TaskBlock, Team
+
+    tournament = Tournament(name="Test")
+    for order in (1, 2):
+        db.session.add(TaskBlock(name=f"Block {order}", order=order, max_duration=600, tournament=tournament))
+    db.session.add(tournament)
+    db.session.flush()
+    for i in range(2):
+        team = Team(name=f"Team {i}", member1="m", tournament_id=tournament.id)
+        team.set_password("p")
+        db.session.add(team)
+    db.session.commit()
+    return tournament
+
+
+@pytest.fixture
+def admin_client(app, monkeypatch):
+    """Клиент для /__admin/*: ключ передавать как key=ADMIN_KEY."""
+    from app.views import admin
+
+    monkeypatch.setattr(admin, "ADMIN_KEY", ADMIN_KEY)
+    return app.test_client()
@@ -0,0 +1,25 @@
+# tests/test_admin.py
+from conftest import ADMIN_KEY
+from app.models import Task
+
+
+def add_task(client, **params):
+    return client.get("/__admin/add_task", query_string=dict(key=ADMIN_KEY, text="t", answer="1", **params))
+
+
+def test_add_task_requires_block_id(db, tournament, admin_client):
+    response = add_task(admin_client, order=1)
+    assert response.status_code == 400
+    assert b"block_id required" in response.data
+
+    response = add_task(admin_client, order=1, block_id=10 ** 6)
+    assert response.status_code == 400
+    assert b"not found" in response.data
+
+
+def test_add_task_order_unique_per_block(db, tournament, admin_client):
+    first, second = sorted(tournament.blocks, key=lambda b: b.order)
+    assert add_task(admin_client, order=1, block_id=first.id).data == "task №'1' added".encode()
+    assert add_task(admin_client, order=1, block_id=second.id).data == "task №'1' added".encode()
+    assert add_task(admin_client, order=1, block_id=first.id).data == "task №'1' already exists".encode()
+    assert Task.query.filter_by(order=1).count() == 2
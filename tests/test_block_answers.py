@@ -0,0 +1,57 @@
+# tests/test_block_answers.py
+from datetime import datetime, timezone, timedelta
+from app.models import Team, TeamBlockStart
+from app.views.api import BLOCK_SUBMIT_GRACE
+
+
+def setup_team(app, db, tournament, started_ago):
+    team = Team.query.filter_by(tournament_id=tournament.id).first()
+    team.started_at = datetime.now(timezone.utc) - timedelta(seconds=started_ago)
+    db.session.commit()
+    client = app.test_client()
+    assert client.post("/auth/login", data={"team_name": team.name, "password": "p"}).status_code == 302
+    blocks = sorted(tournament.blocks, key=lambda b: b.order)
+    return team, client, blocks
+
+
+def post(client, block):
+    return client.post(f"/api/block/{block.id}/answers", json={"answers": [], "fill_empty": True})
+
+
+def test_running_block_accepts_answers(app, db, tournament):
+    _, client, blocks = setup_team(app, db, tournament, started_ago=60)
+    assert post(client, blocks[0]).status_code == 200
+
+
+def test_not_started_block_rejected(app, db, tournament):
+    _, client, blocks = setup_team(app, db, tournament, started_ago=60)
+    response = post(client, blocks[1])
+    assert response.status_code == 409
+    assert response.json == {"ok": False, "error": "Block is not running"}
+
+
+def test_expired_block_accepted_within_grace(app, db, tournament):
+    # первый блок (10 минут) кончился только что
+    _, client, blocks = setup_team(app, db, tournament, started_ago=600 + BLOCK_SUBMIT_GRACE // 2)
+    assert post(client, blocks[0]).status_code == 200
+
+
+def test_finished_block_rejected_after_grace(app, db, tournament):
+    team, client, blocks = setup_team(app, db, tournament, started_ago=3600)
+    db.session.add(TeamBlockStart(
+        team_id=team.id, block_id=blocks[0].id,
+        started_at=team.started_at, finished_at=team.started_at + timedelta(minutes=5),
+    ))
+    db.session.commit()
+    assert post(client, blocks[0]).status_code == 409
+
+
+def test_block_of_other_tournament_not_found(app, db, tournament):
+    from app.models import Tournament, TaskBlock
+
+    other = Tournament(name="Other")
+    block = TaskBlock(name="B", order=1, max_duration=600, tournament=other)
+    db.session.add(other)
+    db.session.commit()
+    _, client, _ = setup_team(app, db, tournament, started_ago=60)
+    assert post(client, block).status_code == 404
@@ -0,0 +1,104 @@
+# tests/test_expiry.py
+from datetime import datetime, timezone, timedelta
+import pytest
+from app.expiry import ExpiryScheduler
+from app.models import Team, TeamBlockStart
+
+START = datetime(2026, 1, 1, 10, 0, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    """Часы, которые двигает тест; wait() не ждёт."""
+
+    def __init__(self, now):
+        self.current = now
+
+    def now(self):
+        return self.current
+
+    def wait(self, wakeup, seconds):
+        pass
+
+    def advance(self, seconds):
+        self.current += timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def started(db, tournament):
+    """Первая команда начала турнир в START — её первый блок идёт до START + 10 минут."""
+    team = Team.query.filter_by(tournament_id=tournament.id).order_by(Team.id).first()
+    team.started_at = START
+    db.session.commit()
+    first_block = min(tournament.blocks, key=lambda b: b.order)
+    return team.id, first_block.id
+
+
+@pytest.fixture
+def schedulers(app):
+    created = []
+
+    def make(clock):
+        scheduler = ExpiryScheduler(app, clock=clock)
+        created.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in created:
+        scheduler.resign()
+
+
+def test_load_schedules_running_block(db, started, schedulers):
+    scheduler = schedulers(FakeClock(START))
+    scheduler.load()
+    assert scheduler.next_deadline() == START + timedelta(minutes=10)
+
+
+def test_run_due_finishes_block_at_deadline(db, started, schedulers):
+    team_id, block_id = started
+    clock = FakeClock(START + timedelta(minutes=5))
+    scheduler = schedulers(clock)
+    scheduler.load()
+
+    assert scheduler.run_due() == []
+    assert TeamBlockStart.query.filter_by(team_id=team_id).count() == 0
+
+    clock.advance(5 * 60 + 1)
+    assert scheduler.run_due() == [(team_id, block_id)]
+    row = TeamBlockStart.query.filter_by(team_id=team_id, block_id=block_id).one()
+    assert row.started_at == START
+    assert row.finished_at == START + timedelta(minutes=10)
+    assert scheduler.next_deadline() is None
+
+
+def test_only_one_scheduler_leads(db, started, schedulers):
+    team_id, block_id = started
+    clock = FakeClock(START + timedelta(hours=1))
+    leader, follower = schedulers(clock), schedulers(clock)
+
+    assert leader.lead()
+    assert not follower.lead()
+    assert follower.tick() == []
+    assert follower.next_deadline() is None
+
+    assert leader.tick() == [(team_id, block_id)]
+    assert TeamBlockStart.query.filter_by(team_id=team_id, block_id=block_id).one().finished_at is not None
+
+    # лидер ушёл — блокировку берёт другой
+    leader.resign()
+    assert follower.lead()
+    assert follower.tick() == []
+
+
+def test_second_scheduler_does_not_refinish(db, started, schedulers):
+    team_id, block_id = started
+    clock = FakeClock(START + timedelta(hours=1))
+    first, second = schedulers(clock), schedulers(clock)
+    first.load()
+    second.load()
+
+    assert first.run_due() == [(team_id, block_id)]
+    finished_at = TeamBlockStart.query.filter_by(team_id=team_id, block_id=block_id).one().finished_at
+    # запись уже есть: повторный проход не меняет время окончания
+    second.run_due()
+    db.session.expire_all()
+    assert TeamBlockStart.query.filter_by(team_id=team_id, block_id=block_id).one().finished_at == finished_at
@@ -0,0 +1,81 @@
+# tests/test_final_results.py
+from datetime import datetime, timezone, timedelta
+import json
+import pytest
+from sqlalchemy import update
+from app.models import FinalResult, Team, TeamBlockStart, Tournament
+from app.snapshots import bump_score_version, final_tables
+
+
+@pytest.fixture
+def finished(db, tournament):
+    """Турнир, в котором обе команды закончили оба блока."""
+    now = datetime.now(timezone.utc)
+    second = max(tournament.blocks, key=lambda b: b.order)
+    for team in Team.query.filter_by(tournament_id=tournament.id):
+        team.started_at = now - timedelta(hours=2)
+        db.session.add(TeamBlockStart(team_id=team.id, block_id=second.id, started_at=now - timedelta(hours=1)))
+    db.session.commit()
+    return tournament
+
+
+def late_write(db, tournament_id):
+    # ответ другого воркера: своя транзакция, закоммиченная посреди сборки
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Tournament).where(Tournament.id == tournament_id)
+            .values(score_version=Tournament.score_version + 1)
+        )
+
+
+def parsed(tables):
+    return None if tables is None else {key: json.loads(body) for key, body in tables.items()}
+
+
+def stored(db, tournament_id):
+    return parsed(dict(
+        db.session.query(FinalResult.key, FinalResult.payload).filter_by(tournament_id=tournament_id).all()
+    ))
+
+
+def test_final_tables_frozen_once(db, finished):
+    builds = []
+
+    def build_all(tournament):
+        builds.append(1)
+        return {"full": {"n": len(builds)}}
+
+    assert parsed(final_tables(finished.id, build_all)) == {"full": {"n": 1}}
+    assert parsed(final_tables(finished.id, build_all)) == {"full": {"n": 1}}
+    assert len(builds) == 1
+    assert stored(db, finished.id) == {"full": {"n": 1}}
+
+
+def test_final_tables_rebuilt_after_late_write(db, finished):
+    builds = []
+
+    def build_all(tournament):
+        builds.append(1)
+        if len(builds) == 1:
+            late_write(db, finished.id)
+        return {"full": {"n": len(builds)}}
+
+    assert parsed(final_tables(finished.id, build_all)) == {"full": {"n": 2}}
+    assert stored(db, finished.id) == {"full": {"n": 2}}
+
+
+def test_final_tables_not_frozen_while_versions_move(db, finished):
+    def build_all(tournament):
+        late_write(db, finished.id)
+        return {"full": {}}
+
+    assert final_tables(finished.id, build_all) is None
+    assert stored(db, finished.id) == {}
+
+
+def test_bump_resets_final_tables(db, finished):
+    final_tables(finished.id, lambda tournament: {"full": {"n": 1}})
+    bump_score_version(finished.id)
+    db.session.commit()
+    assert stored(db, finished.id) == {}
+    assert parsed(final_tables(finished.id, lambda tournament: {"full": {"n": 2}})) == {"full": {"n": 2}}
@@ -0,0 +1,69 @@
+# tests/test_grading.py
+import pytest
+from app.grading import AnswerKey, normalize_answer
+
+
+def test_normalize_answer():
+    assert normalize_answer("  Пётр   Иванов ") == normalize_answer("петр иванов")
+    # латинская "e" вместо кириллической
+    assert normalize_answer("Пeтя") == normalize_answer("Петя")
+
+
+@pytest.mark.parametrize("answer", ["22", "22.0", "22,0", "22.000", " 22 "])
+def test_decimal_equal_by_value(answer):
+    assert AnswerKey("22").check(answer)
+
+
+@pytest.mark.parametrize("answer", ["+22", "022", "2.2e1", "044/2", "22/1", "0x16", "22.", ".22e2", ""])
+def test_arithmetic_forms_rejected(answer):
+    assert not AnswerKey("22").check(answer)
+
+
+def test_fraction_answer_to_decimal_key_rejected():
+    assert not AnswerKey("50").check("150/3")
+    assert not AnswerKey("0.5").check("1/2")
+
+
+def test_decimal_comma_and_negative():
+    key = AnswerKey("-3,5")
+    assert key.check("-3.5")
+    assert key.check("-3,50")
+    assert not key.check("3.5")
+
+
+def test_zero_and_leading_zero_fraction_part():
+    assert AnswerKey("0").check("0.0")
+    assert AnswerKey("0.5").check("0,50")
+    assert not AnswerKey("0.5").check("00.5")
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("1/2", True),
+    ("2/4", False),
+    ("0.5", False),
+    ("-1/2", False),
+    ("1/3", False),
+])
+def test_fraction_key_accepts_only_reduced_fraction(answer, expected):
+    assert AnswerKey("1/2").check(answer) is expected
+
+
+def test_unreduced_fraction_key():
+    key = AnswerKey("2/4")
+    # сам ключ — как строка; иначе — только несократимая запись
+    assert key.check("2/4")
+    assert key.check("1/2")
+    assert not key.check("3/6")
+
+
+def test_alternatives_and_empty_variants():
+    key = AnswerKey("Петя|Пётр||")
+    assert key.check("пётр")
+    assert key.check("ПЕТЯ")
+    assert not key.check("")
+    assert not AnswerKey(None).check("")
+    assert not AnswerKey("").check("")
+
+
+def test_text_key_ignores_numbers():
+    assert not AnswerKey("ответ").check("0")
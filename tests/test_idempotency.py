@@ -0,0 +1,71 @@
+# tests/test_idempotency.py
+from datetime import datetime, timezone, timedelta
+from app import idempotency
+from app.idempotency import IDEMPOTENCY_KEYS_PER_TEAM, prune_idempotency_keys
+from app.models import IdempotencyKey, Task, Team, TeamBlockStart
+
+
+def login(app, team):
+    client = app.test_client()
+    response = client.post("/auth/login", data={"team_name": team.name, "password": "p"})
+    assert response.status_code == 302
+    return client
+
+
+def test_start_block_replay_writes_once(app, db, tournament):
+    team = Team.query.filter_by(tournament_id=tournament.id).first()
+    block = max(tournament.blocks, key=lambda b: b.order)
+    client = login(app, team)
+    headers = {"Idempotency-Key": "start-1"}
+
+    first = client.post("/start_block", json={"block_id": block.id}, headers=headers)
+    again = client.post("/start_block", json={"block_id": block.id}, headers=headers)
+
+    assert first.status_code == 200 and "already_started" not in first.json
+    assert again.headers.get("Idempotent-Replayed") == "true"
+    assert again.data == first.data
+    # ключ записан в той же транзакции, что и старт блока
+    assert IdempotencyKey.query.filter_by(team_id=team.id, key="start-1").count() == 1
+    assert TeamBlockStart.query.filter_by(team_id=team.id, block_id=block.id).count() == 1
+
+    other = client.post("/start_block", json={"block_id": block.id - 1}, headers=headers)
+    assert other.status_code == 200  # тот же путь — повтор
+    assert other.headers.get("Idempotent-Replayed") == "true"
+
+
+def test_prune_removes_expired_and_over_cap(db, tournament, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_PRUNE_BATCH", 7)
+    now = datetime.now(timezone.utc)
+    teams = Team.query.filter_by(tournament_id=tournament.id).order_by(Team.id).all()
+    for team in teams:
+        for i in range(IDEMPOTENCY_KEYS_PER_TEAM + 5):
+            db.session.add(IdempotencyKey(team_id=team.id, key=f"k{i:03d}", path="/start_block", status=200, body="{}", created_at=now))
+    db.session.add(IdempotencyKey(team_id=teams[0].id, key="old", path="/start_block", status=200, body="{}", created_at=now - timedelta(hours=1)))
+    db.session.commit()
+
+    assert prune_idempotency_keys(now) == 11
+    for team in teams:
+        keys = {key for (key,) in db.session.query(IdempotencyKey.key).filter_by(team_id=team.id)}
+        # остаются последние IDEMPOTENCY_KEYS_PER_TEAM
+        assert keys == {f"k{i:03d}" for i in range(5, IDEMPOTENCY_KEYS_PER_TEAM + 5)}
+
+
+def test_write_keeps_team_store_bounded(app, db, tournament):
+    # планировщика в тестах нет (BLOCK_EXPIRY_SCHEDULER=0): ограничивает сама запись
+    team = Team.query.filter_by(tournament_id=tournament.id).first()
+    now = datetime.now(timezone.utc)
+    team.started_at = now - timedelta(seconds=60)
+    for i in range(IDEMPOTENCY_KEYS_PER_TEAM):
+        db.session.add(IdempotencyKey(team_id=team.id, key=f"k{i:03d}", path="/start_block", status=200, body="{}", created_at=now - timedelta(seconds=30)))
+    db.session.add(IdempotencyKey(team_id=team.id, key="old", path="/start_block", status=200, body="{}", created_at=now - timedelta(hours=1)))
+    block = min(tournament.blocks, key=lambda b: b.order)
+    db.session.add(Task(order=1, text="t", correct_answer="1", block=block))
+    db.session.commit()
+    client = login(app, team)
+
+    response = client.post(f"/api/block/{block.id}/answers", json={"answers": [], "fill_empty": True}, headers={"Idempotency-Key": "new"})
+
+    assert response.status_code == 200
+    keys = {key for (key,) in db.session.query(IdempotencyKey.key).filter_by(team_id=team.id)}
+    assert len(keys) == IDEMPOTENCY_KEYS_PER_TEAM
+    assert "new" in keys and "old" not in keys and "k000" not in keys
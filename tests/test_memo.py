@@ -0,0 +1,79 @@
+# tests/test_memo.py
+from datetime import datetime, timezone, timedelta
+import pytest
+from flask import g
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app import memo
+from app.models import Team, TeamBlockStart
+from app.utils import TeamTimeline
+
+
+@pytest.fixture
+def request_memo(app, db):
+    """Пустой кеш запроса (g живёт в app context фикстуры db)."""
+    g.pop("memo", None)
+    g.pop("memo_stats", None)
+
+
+@pytest.fixture
+def running(db, tournament):
+    """(команда, первый блок), первый блок идёт."""
+    team = Team.query.filter_by(tournament_id=tournament.id).first()
+    team.started_at = datetime.now(timezone.utc) - timedelta(seconds=60)
+    db.session.commit()
+    return team, min(tournament.blocks, key=lambda b: b.order)
+
+
+def test_cached_loads_once_per_request(request_memo):
+    loads = []
+
+    def load():
+        loads.append(1)
+        return len(loads)
+
+    assert memo.cached("timeline", 1, load) == 1
+    assert memo.cached("timeline", 1, load) == 1
+    assert memo.cached("timeline", 2, load) == 2
+    assert memo.stats() == {"hits": 1, "misses": 2}
+
+    memo.invalidate("other")
+    assert memo.cached("timeline", 1, load) == 1
+    memo.invalidate("timeline")
+    assert memo.cached("timeline", 1, load) == 3
+
+
+def test_read_after_flush_in_same_request(db, request_memo, running):
+    team, block = running
+    timeline = TeamTimeline.load(team, block.tournament_id)
+    assert timeline.state == "running"
+    assert TeamTimeline.load(team, block.tournament_id) is timeline
+
+    # блок закончен в этом же запросе: after_flush сбрасывает время блоков
+    db.session.add(TeamBlockStart(
+        team_id=team.id, block_id=block.id, started_at=team.started_at, finished_at=datetime.now(timezone.utc),
+    ))
+    db.session.flush()
+
+    fresh = TeamTimeline.load(team, block.tournament_id)
+    assert fresh is not timeline
+    assert fresh.get(block).state == "finished"
+    assert fresh.state == "waiting"
+
+
+def test_read_after_bulk_write_in_same_request(db, request_memo, running):
+    team, block = running
+    assert TeamTimeline.load(team, block.tournament_id).state == "running"
+
+    # INSERT ... ON CONFLICT идёт мимо flush — сбрасывается весь кеш запроса
+    db.session.execute(pg_insert(TeamBlockStart).values(
+        team_id=team.id, block_id=block.id, started_at=team.started_at, finished_at=datetime.now(timezone.utc),
+    ).on_conflict_do_nothing())
+
+    assert TeamTimeline.load(team, block.tournament_id).state == "waiting"
+
+
+def test_no_app_context_means_no_cache(app):
+    loads = []
+    assert memo.cached("timeline", 1, lambda: loads.append(1)) is None
+    assert memo.cached("timeline", 1, lambda: loads.append(1)) is None
+    assert len(loads) == 2
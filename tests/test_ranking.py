@@ -0,0 +1,124 @@
+# tests/test_ranking.py
+import pytest
+from app.ranking import Ranking, rank_rows
+
+
+def make():
+    return Ranking([(1, 10, "A"), (2, 30, "B"), (3, 10, "C"), (4, 5, "D")])
+
+
+def test_order_and_labels_with_ties():
+    ranking = make()
+    assert ranking.ordered() == [2, 1, 3, 4]
+    assert ranking.labels() == {2: "1", 1: "2-3", 3: "2-3", 4: "4"}
+    assert ranking.label(3) == "2-3"
+    assert ranking.tie_range(1) == (2, 3)
+    assert ranking.position(4) == 3
+    assert ranking.total(2) == 30
+
+
+def test_update_moves_team():
+    ranking = make()
+    ranking.update(4, 40, "D")
+    assert ranking.ordered() == [4, 2, 1, 3]
+    assert ranking.label(4) == "1"
+    # те же очки и имя — без изменений
+    ranking.update(4, 40, "D")
+    assert len(ranking) == 4
+
+
+def test_update_adds_and_remove_drops():
+    ranking = make()
+    ranking.update(5, 10, "E")
+    assert ranking.labels()[5] == "2-4"
+    ranking.remove(1)
+    ranking.remove(99)
+    assert 1 not in ranking
+    assert ranking.ordered() == [2, 3, 5, 4]
+    assert ranking.label(3) == "2-3"
+
+
+def test_copy_is_isolated():
+    ranking = make()
+    clone = ranking.copy()
+    clone.update(4, 100, "D")
+    clone.remove(2)
+    assert ranking.ordered() == [2, 1, 3, 4]
+    assert ranking.total(4) == 5
+    assert 2 in ranking
+    assert clone.ordered() == [4, 1, 3]
+
+
+def test_rank_rows():
+    rows = [
+        {"team_id": 1, "team_name": "B", "total": 3},
+        {"team_id": 2, "team_name": "A", "total": 3},
+        {"team_id": 3, "team_name": "C", "total": 7},
+    ]
+    rank_rows(rows)
+    assert [r["team_id"] for r in rows] == [3, 2, 1]
+    assert [r["rank_label"] for r in rows] == ["1", "2-3", "2-3"]
+
+
+@pytest.fixture
+def scored(db, tournament):
+    """(tournament_id, [team_id, team_id], set_points(team_id, points)) — очки в team_scores."""
+    from app.models import Task, Team, TeamScore
+
+    block = min(tournament.blocks, key=lambda b: b.order)
+    task = Task(order=1, text="t", correct_answer="1", block=block)
+    db.session.add(task)
+    db.session.commit()
+    teams = [t.id for t in Team.query.filter_by(tournament_id=tournament.id).order_by(Team.id)]
+
+    def set_points(team_id, points):
+        db.session.merge(TeamScore(
+            team_id=team_id, task_id=task.id, block_id=block.id, tournament_id=tournament.id, points=points,
+        ))
+
+    return tournament.id, teams, set_points
+
+
+def test_tournament_ranking_applies_only_changed_teams(db, scored):
+    from app import scoreboard
+    from app.snapshots import bump_score_version, current_score_version
+
+    tournament_id, (a, b), set_points = scored
+    first = scoreboard.tournament_ranking(tournament_id, current_score_version(tournament_id))
+    assert first.total(a) == first.total(b) == 0
+
+    set_points(a, 5)
+    bump_score_version(tournament_id, [a])
+    # очки b меняются без события с его id: пересчёт только по a их не увидит
+    set_points(b, 7)
+    db.session.commit()
+    version = current_score_version(tournament_id)
+    # событие от слушателя могло ещё не прийти — кладём его в журнал сами
+    scoreboard._on_scoreboard_event({"k": tournament_id, "v": version, "teams": [a]})
+
+    ranking = scoreboard.tournament_ranking(tournament_id, version)
+    assert (ranking.total(a), ranking.total(b)) == (5, 0)
+    assert ranking.ordered() == [a, b]
+    # опубликованный Ranking прежней версии не изменился
+    assert first.total(a) == 0
+
+
+def test_tournament_ranking_full_rebuild_without_events(db, scored):
+    from sqlalchemy import update
+    from app import scoreboard
+    from app.models import Tournament
+    from app.snapshots import current_score_version
+
+    tournament_id, (a, b), set_points = scored
+    scoreboard.tournament_ranking(tournament_id, current_score_version(tournament_id))
+
+    # версия сменилась без события (как после пропущенного NOTIFY)
+    set_points(b, 7)
+    db.session.execute(
+        update(Tournament).where(Tournament.id == tournament_id).values(score_version=Tournament.score_version + 1)
+    )
+    db.session.commit()
+
+    ranking = scoreboard.tournament_ranking(tournament_id, current_score_version(tournament_id))
+    assert (ranking.total(a), ranking.total(b)) == (0, 7)
+    assert ranking.label(b) == "1"
@@ -0,0 +1,68 @@
+# tests/test_regrade.py
+from datetime import datetime, timezone, timedelta
+import pytest
+from conftest import ADMIN_KEY
+from app.models import Answer, Task, Team, TeamScore
+from app.snapshots import current_score_version
+
+
+@pytest.fixture
+def answered(app, db, tournament):
+    """Задача с ключом "1" (3 балла), на которую команда ответила "2"."""
+    team = Team.query.filter_by(tournament_id=tournament.id).first()
+    team.started_at = datetime.now(timezone.utc) - timedelta(seconds=60)
+    block = min(tournament.blocks, key=lambda b: b.order)
+    task = Task(order=1, text="t", correct_answer="1", points=3, block=block)
+    db.session.add(task)
+    # вторая задача, чтобы ответ не заканчивал блок
+    db.session.add(Task(order=2, text="t", correct_answer="1", block=block))
+    db.session.commit()
+
+    client = app.test_client()
+    assert client.post("/auth/login", data={"team_name": team.name, "password": "p"}).status_code == 302
+    response = client.post(f"/api/task/{task.id}", json={"answer": "2"})
+    assert response.status_code == 200 and response.json["is_correct"] is False
+    return tournament.id, team.id, task.id
+
+
+def regrade(client, **params):
+    response = client.get("/__admin/regrade", query_string=dict(key=ADMIN_KEY, **params))
+    assert response.status_code == 200
+    return response.json
+
+
+def points(db, team_id, task_id):
+    db.session.expire_all()
+    return db.session.get(TeamScore, (team_id, task_id)).points
+
+
+def test_regrade_after_key_fix(db, answered, admin_client):
+    tournament_id, team_id, task_id = answered
+    version = current_score_version(tournament_id)
+    db.session.get(Task, task_id).correct_answer = "2"
+    db.session.commit()
+
+    assert regrade(admin_client, task_id=task_id) == {
+        "tasks": 1, "answers": 1, "changed": 1, "tournament_id": tournament_id,
+    }
+    answer = Answer.query.filter_by(team_id=team_id, task_id=task_id).one()
+    assert (answer.is_correct, answer.points) == (True, 3)
+    assert points(db, team_id, task_id) == 3
+    # таблицы результатов и итоги сброшены
+    assert current_score_version(tournament_id) == version + 1
+
+
+def test_regrade_without_changes_keeps_version(db, answered, admin_client):
+    tournament_id, team_id, task_id = answered
+    version = current_score_version(tournament_id)
+
+    stats = regrade(admin_client, tournament_id=tournament_id)
+
+    assert stats["changed"] == 0 and stats["answers"] == 1
+    assert current_score_version(tournament_id) == version
+    assert points(db, team_id, task_id) == 0
+
+
+def test_regrade_requires_target(db, admin_client):
+    response = admin_client.get("/__admin/regrade", query_string={"key": ADMIN_KEY})
+    assert response.status_code == 400
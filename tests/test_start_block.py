@@ -0,0 +1,65 @@
+# tests/test_start_block.py
+from datetime import datetime, timezone, timedelta
+import pytest
+from sqlalchemy import delete, event
+from app.models import Team, TeamBlockStart
+from app.views import tasks
+
+
+@pytest.fixture
+def started(app, db, tournament):
+    """(client, team_id, второй блок), второй блок уже начат с другого устройства."""
+    team = Team.query.filter_by(tournament_id=tournament.id).first()
+    block = max(tournament.blocks, key=lambda b: b.order)
+    db.session.add(TeamBlockStart(team_id=team.id, block_id=block.id, started_at=datetime.now(timezone.utc) - timedelta(seconds=5)))
+    db.session.commit()
+    client = app.test_client()
+    assert client.post("/auth/login", data={"team_name": team.name, "password": "p"}).status_code == 302
+    return client, team.id, block
+
+
+@pytest.fixture
+def reset_once(db):
+    """
+    Удаляет начала блоков (как сброс команды) перед первым перечитыванием в
+    start_block — между конфликтующим INSERT и чтением. Возвращает список
+    перечитываний.
+    """
+    rereads = []
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT team_block_start.started_at"):
+            rereads.append(statement)
+            if len(rereads) == 1:
+                with db.engine.begin() as other:
+                    other.execute(delete(TeamBlockStart))
+
+    event.listen(db.engine, "before_cursor_execute", before)
+    yield rereads
+    event.remove(db.engine, "before_cursor_execute", before)
+
+
+def test_already_started(started):
+    client, _, block = started
+    response = client.post("/start_block", json={"block_id": block.id})
+    assert response.status_code == 200
+    assert response.json["already_started"] is True
+
+
+def test_start_retried_after_concurrent_reset(db, started, reset_once):
+    client, team_id, block = started
+    response = client.post("/start_block", json={"block_id": block.id})
+
+    assert response.status_code == 200
+    assert "already_started" not in response.json
+    assert len(reset_once) == 1
+    assert TeamBlockStart.query.filter_by(team_id=team_id, block_id=block.id).count() == 1
+
+
+def test_start_gives_up_with_409(db, started, reset_once, monkeypatch):
+    client, _, block = started
+    monkeypatch.setattr(tasks, "START_BLOCK_ATTEMPTS", 1)
+    response = client.post("/start_block", json={"block_id": block.id})
+
+    assert response.status_code == 409
+    assert response.json == {"ok": False, "error": "Block start conflicted with a reset, try again"}
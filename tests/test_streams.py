@@ -0,0 +1,47 @@
+# tests/test_streams.py
+from app.events import SCOREBOARD_CHANNEL, TEAM_CHANNEL, hub
+from app.models import Team
+
+
+def open_stream(client, url):
+    # ответ не читаем: генератор так и не начинается
+    return client.get(url, buffered=False)
+
+
+def test_streams_capped_per_worker(app, db, tournament, monkeypatch):
+    monkeypatch.setitem(app.config, "SSE_STREAMS_PER_WORKER", 1)
+    client = app.test_client()
+    url = f"/api/dashboard/{tournament.id}/stream"
+
+    first = open_stream(client, url)
+    assert first.status_code == 200
+    assert first.mimetype == "text/event-stream"
+
+    rejected = open_stream(client, url)
+    assert rejected.status_code == 503
+    assert rejected.headers["Retry-After"]
+    assert rejected.json == {"error": "Too many streams, use polling"}
+
+    first.close()
+    again = open_stream(client, url)
+    assert again.status_code == 200
+    again.close()
+    assert (SCOREBOARD_CHANNEL, tournament.id) not in hub._subs
+
+
+def test_team_and_dashboard_streams_share_cap(app, db, tournament, monkeypatch):
+    monkeypatch.setitem(app.config, "SSE_STREAMS_PER_WORKER", 1)
+    team = Team.query.filter_by(tournament_id=tournament.id).first()
+    client = app.test_client()
+    assert client.post("/auth/login", data={"team_name": team.name, "password": "p"}).status_code == 302
+
+    dashboard = open_stream(client, f"/api/dashboard/{tournament.id}/stream")
+    assert dashboard.status_code == 200
+    assert open_stream(client, f"/api/tournament/{tournament.id}/events").status_code == 503
+    assert (TEAM_CHANNEL, team.id) not in hub._subs
+
+    dashboard.close()
+    events = open_stream(client, f"/api/tournament/{tournament.id}/events")
+    assert events.status_code == 200
+    events.close()
+    assert (TEAM_CHANNEL, team.id) not in hub._subs